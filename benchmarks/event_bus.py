@@ -0,0 +1,192 @@
+"""
+Micro-benchmark of the event bus.
+
+Drives a broker with a configurable amount of suscriber processes, mix of
+events and payload size. Reports publish latency percentiles, end to end
+delivery latency to the suscribers and sustained throughput.
+
+    python benchmarks/event_bus.py --transport manager --subscribers 4 --events 5000
+    python benchmarks/event_bus.py --transport shm --mix TimeChange:9,App:1 --json shm.json
+"""
+
+import argparse
+from contextlib import contextmanager
+import json
+import multiprocessing
+import os
+import random
+import statistics
+import sys
+import time
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), "..", "src"))
+
+from messages import Event, EventMsg, EventBroker, EventBrokerManager
+from shared_memory_broker import SharedMemoryEventBroker
+
+TRANSPORTS = ["manager", "shm", "inprocess"]
+
+def main():
+    args = _build_parser().parse_args()
+    args.transport = args.transport or TRANSPORTS
+
+    results = [run(transport, args) for transport in args.transport]
+
+    for result in results:
+        print_report(result)
+
+    if args.json:
+        with open(args.json, "w") as report:
+            json.dump(results, report, indent=2)
+
+def run(transport, args):
+    mix = parse_mix(args.mix)
+    events = list(mix.keys())
+    padding = "x" * args.payload_size
+
+    with broker_for(transport, args.payload_size) as broker:
+        ready = multiprocessing.Barrier(args.subscribers + 1)
+        results = multiprocessing.SimpleQueue()
+        subscribers = [
+                multiprocessing.Process(
+                    target=subscriber,
+                    args=(broker, events, ready, results, _pipe_in_publisher(transport, broker, events)))
+                for _ in range(args.subscribers)]
+        for process in subscribers:
+            process.start()
+
+        ready.wait()
+
+        kinds = random.Random(args.seed).choices(events, weights=list(mix.values()), k=args.events)
+        publish_latencies = []
+        begin = time.monotonic()
+        for kind in kinds:
+            msg = EventMsg(kind, "{:.9f}|{}".format(time.monotonic(), padding))
+            before = time.perf_counter()
+            broker.publish(msg)
+            publish_latencies.append(time.perf_counter() - before)
+        publish_elapsed = time.monotonic() - begin
+
+        broker.publish(EventMsg(Event.Termination))
+
+        delivery_latencies = []
+        delivered = 0
+        last_delivery = begin
+        for _ in subscribers:
+            latencies, finished_at = results.get()
+            delivery_latencies.extend(latencies)
+            delivered += len(latencies)
+            last_delivery = max(last_delivery, finished_at)
+
+        for process in subscribers:
+            process.join()
+
+    return {
+        "transport": transport,
+        "subscribers": args.subscribers,
+        "events": args.events,
+        "payload_size": args.payload_size,
+        "mix": args.mix,
+        "publish_latency_us": percentiles(publish_latencies),
+        "delivery_latency_us": percentiles(delivery_latencies),
+        "publish_throughput": args.events / publish_elapsed,
+        "delivery_throughput": delivered / (last_delivery - begin),
+        "delivered": delivered,
+    }
+
+def _pipe_in_publisher(transport, broker, events):
+    """A broker in the publisher process can't be reached by the forked suscribers"""
+    if transport == "inprocess":
+        return broker.suscribe(*events, Event.Termination, suscriber=os.getpid())
+    return None
+
+def subscriber(broker, events, ready, results, pipe=None):
+    owns_subscription = pipe is None
+    if owns_subscription:
+        pipe = broker.suscribe(*events, Event.Termination, suscriber=os.getpid())
+    ready.wait()
+
+    latencies = []
+    while True:
+        msg = pipe.recv()
+        now = time.monotonic()
+        if msg.kind == Event.Termination:
+            break
+        sent_at = float(msg.msg.split("|", 1)[0])
+        latencies.append(now - sent_at)
+
+    results.put((latencies, time.monotonic()))
+    if owns_subscription:
+        broker.unsuscribe(os.getpid(), [*events, Event.Termination])
+
+@contextmanager
+def broker_for(transport, payload_size):
+    if transport == "manager":
+        EventBrokerManager.register("EventBroker", EventBroker)
+        with EventBrokerManager() as manager:
+            yield manager.EventBroker()
+    elif transport == "shm":
+        broker = SharedMemoryEventBroker(slot_size=payload_size + 256)
+        try:
+            yield broker
+        finally:
+            broker.shutdown()
+    else:
+        # Broker living in the publisher process, only the delivery through
+        # the pipes is measured.
+        yield EventBroker()
+
+def percentiles(samples):
+    if not samples:
+        return {}
+
+    ordered = sorted(samples)
+    def at(fraction):
+        return ordered[min(len(ordered) - 1, int(fraction * len(ordered)))] * 1e6
+
+    return {
+        "p50": at(0.50),
+        "p90": at(0.90),
+        "p99": at(0.99),
+        "max": ordered[-1] * 1e6,
+        "mean": statistics.fmean(ordered) * 1e6,
+    }
+
+def parse_mix(mix):
+    weights = {}
+    for entry in mix.split(","):
+        name, _, weight = entry.partition(":")
+        weights[Event[name.strip()]] = float(weight) if weight else 1.0
+    return weights
+
+def print_report(result):
+    print("== {} | {} suscriptores | {} eventos | payload {} bytes | mix {}".format(
+        result["transport"], result["subscribers"], result["events"], result["payload_size"], result["mix"]))
+    for name in ["publish_latency_us", "delivery_latency_us"]:
+        values = result[name]
+        print("   {:<22} {}".format(name, "  ".join("{}={:.1f}".format(k, v) for k, v in values.items())))
+    print("   {:<22} {:.0f} eventos/s".format("publish_throughput", result["publish_throughput"]))
+    print("   {:<22} {:.0f} entregas/s ({} entregas)".format("delivery_throughput", result["delivery_throughput"], result["delivered"]))
+
+def _build_parser():
+    parser = argparse.ArgumentParser(description="Benchmark del bus de eventos")
+    parser.add_argument(
+            "--transport",
+            choices=TRANSPORTS,
+            action="append",
+            help="Transporte a medir. Se puede repetir, por defecto se miden todos.")
+    parser.add_argument("--subscribers", type=int, default=3, help="Cantidad de procesos suscriptores.")
+    parser.add_argument("--events", type=int, default=2000, help="Cantidad de eventos a publicar.")
+    parser.add_argument(
+            "--mix",
+            type=str,
+            default="TimeChange:8,App:1,PomodoroFinished:1",
+            help="Eventos a publicar con su peso relativo. Ej: TimeChange:9,App:1")
+    parser.add_argument("--payload-size", type=int, default=16, help="Bytes de relleno en cada mensaje.")
+    parser.add_argument("--seed", type=int, default=0, help="Semilla para generar la secuencia de eventos.")
+    parser.add_argument("--json", type=str, default=None, help="Archivo donde escribir los resultados en JSON.")
+
+    return parser
+
+if __name__ == "__main__":
+    main()
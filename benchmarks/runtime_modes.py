@@ -0,0 +1,134 @@
+"""
+Compares the process per loop runtime against --single-process.
+
+Starts the app on a pseudo terminal for each mode and reports the time until
+the screen is first drawn and the peak resident memory summed over the whole
+process tree (the manager server and the children included).
+
+    python benchmarks/runtime_modes.py -- --test timer 1
+    python benchmarks/runtime_modes.py --seconds 10 --json modes.json -- pomodoro 2
+"""
+
+import argparse
+import json
+import os
+import pty
+import select
+import signal
+import sys
+import time
+
+APP = os.path.join(os.path.dirname(os.path.abspath(__file__)), "..", "src", "temporizador_logger.py")
+
+MODES = {
+    "processes": [],
+    "single-process": ["--single-process"],
+}
+
+_SCREEN_DRAWN = b"\x1b[?1049h" # curses switching to the alternate screen
+
+def main():
+    args = _build_parser().parse_args()
+    app_args = args.app_args or ["timer", "1"]
+
+    results = [run(mode, app_args, args.seconds) for mode in MODES]
+
+    for result in results:
+        print_report(result)
+
+    if args.json:
+        with open(args.json, "w") as report:
+            json.dump(results, report, indent=2)
+
+def run(mode, app_args, seconds):
+    begin = time.monotonic()
+    pid, fd = pty.fork()
+    if pid == 0:
+        os.execv(sys.executable, [sys.executable, APP, *MODES[mode], *app_args])
+
+    output = b""
+    startup = None
+    peak_rss = 0
+    processes = 0
+    while time.monotonic() - begin < seconds:
+        if select.select([fd], [], [], 0.01)[0]:
+            try:
+                output += os.read(fd, 65536)
+            except OSError:
+                break
+        if startup is None and _SCREEN_DRAWN in output:
+            startup = time.monotonic() - begin
+
+        tree = process_tree(pid)
+        peak_rss = max(peak_rss, sum(rss_kib(child) for child in tree))
+        processes = max(processes, len(tree))
+
+    os.kill(pid, signal.SIGINT)
+    _reap(pid, fd)
+
+    return {
+        "mode": mode,
+        "args": app_args,
+        "startup_s": startup,
+        "peak_rss_kib": peak_rss,
+        "processes": processes,
+    }
+
+def process_tree(root):
+    children = {}
+    for entry in os.listdir("/proc"):
+        if not entry.isdigit():
+            continue
+        try:
+            with open("/proc/{}/stat".format(entry)) as stat:
+                # the command name can hold spaces, the parent pid follows it
+                ppid = int(stat.read().rsplit(")", 1)[1].split()[1])
+        except (OSError, IndexError, ValueError):
+            continue
+        children.setdefault(ppid, []).append(int(entry))
+
+    tree = [root]
+    for pid in tree:
+        tree.extend(children.get(pid, []))
+    return tree
+
+def rss_kib(pid):
+    try:
+        with open("/proc/{}/status".format(pid)) as status:
+            for line in status:
+                if line.startswith("VmRSS:"):
+                    return int(line.split()[1])
+    except OSError:
+        pass
+    return 0
+
+def _reap(pid, fd):
+    deadline = time.monotonic() + 5
+    while time.monotonic() < deadline:
+        if select.select([fd], [], [], 0.05)[0]:
+            try:
+                os.read(fd, 65536)
+            except OSError:
+                pass
+        if os.waitpid(pid, os.WNOHANG)[0]:
+            break
+    else:
+        os.killpg(os.getpgid(pid), signal.SIGKILL)
+        os.waitpid(pid, 0)
+    os.close(fd)
+
+def print_report(result):
+    startup = "-" if result["startup_s"] is None else "{:.0f} ms".format(result["startup_s"] * 1e3)
+    print("== {:<15} arranque {:>8} | memoria pico {:>7.1f} MiB | {} procesos".format(
+        result["mode"], startup, result["peak_rss_kib"] / 1024, result["processes"]))
+
+def _build_parser():
+    parser = argparse.ArgumentParser(description="Compara el arranque y la memoria de los modos de ejecución")
+    parser.add_argument("--seconds", type=float, default=5, help="Segundos que se deja corriendo la aplicación en cada modo.")
+    parser.add_argument("--json", type=str, default=None, help="Archivo donde escribir los resultados en JSON.")
+    parser.add_argument("app_args", nargs="*", help="Argumentos para la aplicación, después de '--'. Por defecto 'timer 1'.")
+
+    return parser
+
+if __name__ == "__main__":
+    main()
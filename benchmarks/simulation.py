@@ -0,0 +1,132 @@
+"""
+Simulated sessions on a virtual clock.
+
+Runs whole Pomodoro and Timer sessions, breaks, log writes and events
+included, on a clock.VirtualClock over an in-process broker. Checks that each
+one lasted and logged the pomodoros it should and reports how long it takes
+to simulate a session and how many ticks it published for the screen.
+
+    python benchmarks/simulation.py --sessions 1000
+    python benchmarks/simulation.py --resolution minutes
+    python benchmarks/simulation.py --pomodoros 4 --pomodoro-time 25 --break-time 5 --json sim.json
+"""
+
+import argparse
+import json
+import os
+import statistics
+import sys
+import tempfile
+import time
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), "..", "src"))
+
+from clock import VirtualClock
+from global_data import TEMPORARY_PATH
+from messages import EventBroker, Resolution, event_printer_ready
+from runtime import run_loop_virtual
+from timer import pomodoro, timer
+
+KINDS = ["pomodoro", "timer"]
+
+def main():
+    args = _build_parser().parse_args()
+    args.kind = args.kind or KINDS
+
+    with tempfile.TemporaryDirectory() as home:
+        # The status block of every session points from the home of the user
+        os.environ["HOME"] = home
+        os.makedirs(os.path.join(home, TEMPORARY_PATH))
+
+        broker = EventBroker()
+        results = [run(kind, broker, home, args) for kind in args.kind]
+
+    for result in results:
+        print_report(result)
+
+    if args.json:
+        with open(args.json, "w") as report:
+            json.dump(results, report, indent=2)
+
+    if any(result["failures"] for result in results):
+        sys.exit(1)
+
+def run(kind, broker, home, args):
+    log_file = os.path.join(home, "{}.log".format(kind))
+    expected_seconds, expected_pomodoros = expected_session(kind, args)
+
+    durations = []
+    failures = 0
+    ticks_before = broker.metrics()["published"].get("TimeChange", 0)
+    for _ in range(args.sessions):
+        open(log_file, "w").close()
+        clock = VirtualClock()
+
+        begin = time.perf_counter()
+        run_loop_virtual(session(kind, broker, log_file, clock, args), clock)
+        durations.append(time.perf_counter() - begin)
+
+        with open(log_file) as log:
+            pomodoros = sum(1 for line in log if line.strip())
+        if clock.monotonic() != expected_seconds or pomodoros != expected_pomodoros:
+            failures += 1
+
+    return {
+        "kind": kind,
+        "sessions": args.sessions,
+        "simulated_seconds": expected_seconds,
+        "session_ms": {
+            "p50": statistics.median(durations) * 1e3,
+            "max": max(durations) * 1e3,
+            "mean": statistics.fmean(durations) * 1e3,
+        },
+        "speedup": expected_seconds / statistics.fmean(durations),
+        "ticks_per_session": (broker.metrics()["published"].get("TimeChange", 0) - ticks_before) / args.sessions,
+        "failures": failures,
+    }
+
+def session(kind, broker, log_file, clock, args):
+    resolution = Resolution[args.resolution.capitalize()]
+    if kind == "pomodoro":
+        loop = pomodoro(args.pomodoros, None, args.pomodoro_time, args.break_time, log_file, broker, None, resolution=resolution, clock=clock)
+    else:
+        loop = timer(args.pomodoros * args.pomodoro_time, None, log_file, args.pomodoro_time, broker, None, resolution=resolution, clock=clock)
+
+    # Nobody draws the screen, the countdown starts right away
+    event_printer_ready(broker)
+    return loop
+
+def expected_session(kind, args):
+    if kind == "pomodoro":
+        return (args.pomodoros * args.pomodoro_time + (args.pomodoros - 1) * args.break_time) * 60, args.pomodoros
+    return args.pomodoros * args.pomodoro_time * 60, args.pomodoros
+
+def print_report(result):
+    print("== {} | {} sesiones de {} segundos simulados".format(result["kind"], result["sessions"], result["simulated_seconds"]))
+    print("   {:<12} {}".format("session_ms", "  ".join("{}={:.2f}".format(k, v) for k, v in result["session_ms"].items())))
+    print("   {:<12} {:.0f}x".format("speedup", result["speedup"]))
+    print("   {:<12} {:.0f}".format("ticks", result["ticks_per_session"]))
+    print("   {:<12} {}".format("failures", result["failures"]))
+
+def _build_parser():
+    parser = argparse.ArgumentParser(description="Simula sesiones completas sobre un reloj virtual")
+    parser.add_argument(
+            "--kind",
+            choices=KINDS,
+            action="append",
+            help="Tipo de sesión a simular. Se puede repetir, por defecto se simulan todos.")
+    parser.add_argument("--sessions", type=int, default=100, help="Cantidad de sesiones a simular de cada tipo.")
+    parser.add_argument("--pomodoros", type=int, default=4, help="Pomodoros de cada sesión.")
+    parser.add_argument("--pomodoro-time", type=int, default=25, help="Minutos de cada pomodoro.")
+    parser.add_argument("--break-time", type=int, default=5, help="Minutos de cada descanso.")
+    parser.add_argument(
+            "--resolution",
+            choices=[resolution.name.lower() for resolution in Resolution],
+            default="seconds",
+            help="Resolución de la pantalla, de la que depende cada cuánto se publica un tick.")
+    parser.add_argument("--json", type=str, default=None, help="Archivo donde escribir los resultados en JSON.")
+
+    return parser
+
+if __name__ == "__main__":
+    main()
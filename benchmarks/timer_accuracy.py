@@ -0,0 +1,297 @@
+"""
+Accuracy of the countdowns on the real clock, under load.
+
+Runs Timer and Pomodoro sessions on their own process and over the event
+bus, as the app does, while other processes keep the CPU busy and flood the
+bus. The countdown waits on the system clock but sees the session on a clock
+`--speed` times faster, so a minute of session lasts 60/speed seconds and a
+whole session takes a few seconds. Everything is reported in real
+milliseconds:
+
+    end_lateness     when the session ends against the length asked for
+    tick_jitter      how far each TimeChange falls from a session second after the previous one
+    log_lateness     when each pomodoro line shows up in the log against the end of its pomodoro
+
+Times are counted from the arrival of TimerInitiated. The JSON report is meant
+to compare a change of the scheduler in src/timer.py against the previous one.
+
+    python benchmarks/timer_accuracy.py
+    python benchmarks/timer_accuracy.py --cpu 4 --ipc 2000 --json carga.json
+"""
+
+import argparse
+from contextlib import contextmanager
+from datetime import datetime, timedelta
+import json
+import multiprocessing
+import os
+import statistics
+import sys
+import tempfile
+import threading
+import time
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), "..", "src"))
+
+from global_data import TEMPORARY_PATH
+from messages import Event, EventMsg, EventBroker, EventBrokerManager, event_printer_ready, suscriber_id
+from runtime import Wait, run_loop
+from shared_memory_broker import SharedMemoryEventBroker
+from timer import pomodoro, timer
+
+KINDS = ["pomodoro", "timer"]
+TRANSPORTS = ["manager", "shm"]
+
+class ScaledClock:
+    """The system clock running speed times faster from the moment it is created"""
+    def __init__(self, speed):
+        self._speed = speed
+        self._origin = time.monotonic()
+        self._wall_origin = datetime.now()
+
+    def monotonic(self):
+        return self._origin + (time.monotonic() - self._origin) * self._speed
+
+    def now(self):
+        return self._wall_origin + timedelta(seconds=self.monotonic() - self._origin)
+
+    def time(self):
+        return time.time()
+
+def main():
+    args = _build_parser().parse_args()
+    args.kind = args.kind or KINDS
+
+    with tempfile.TemporaryDirectory() as home:
+        # The status block and the checkpoint of the countdown point from the home of the user
+        os.environ["HOME"] = home
+        os.makedirs(os.path.join(home, TEMPORARY_PATH))
+
+        with broker_for(args.transport) as broker, load(broker, args):
+            results = [run(kind, broker, home, args) for kind in args.kind]
+
+    for result in results:
+        print_report(result)
+
+    if args.json:
+        with open(args.json, "w") as report:
+            json.dump(results, report, indent=2)
+
+def run(kind, broker, home, args):
+    log_file = os.path.join(home, "{}.log".format(kind))
+    seconds, pomodoro_ends = session_plan(kind, args)
+    scale = 1 / args.speed
+
+    end_lateness = []
+    tick_jitter = []
+    log_lateness = []
+    ticks = 0
+    for _ in range(args.sessions):
+        open(log_file, "w").close()
+        watcher = LogWatcher(log_file)
+
+        begin, tick_arrivals, end = run_session(kind, broker, log_file, args)
+        lines = watcher.stop()
+
+        end_lateness.append(end - begin - seconds * scale)
+        tick_jitter.extend(abs(later - earlier - scale) for earlier, later in zip(tick_arrivals, tick_arrivals[1:]))
+        log_lateness.extend(at - (begin + end_at * scale) for at, end_at in zip(lines, pomodoro_ends))
+        ticks += len(tick_arrivals)
+
+    return {
+        "kind": kind,
+        "transport": args.transport,
+        "sessions": args.sessions,
+        "speed": args.speed,
+        "cpu": args.cpu,
+        "ipc": args.ipc,
+        "end_lateness_ms": percentiles(end_lateness),
+        "tick_jitter_ms": percentiles(tick_jitter),
+        "log_lateness_ms": percentiles(log_lateness),
+        "ticks_per_session": ticks / args.sessions,
+    }
+
+def run_session(kind, broker, log_file, args):
+    """Arrival of TimerInitiated, of every TimeChange and of TimerFinished"""
+    suscriber = suscriber_id("probe")
+    events = [Event.TimerInitiated, Event.TimeChange, Event.TimerFinished]
+    pipe = broker.suscribe(*events, suscriber=suscriber)
+    # What the previous sessions left retained on the bus doesn't count
+    while pipe.poll():
+        pipe.recv()
+    # Nobody draws the screen, the countdown starts right away
+    event_printer_ready(broker)
+
+    process = multiprocessing.Process(target=countdown_process, args=(kind, broker, log_file, args))
+    process.start()
+
+    begin = None
+    ticks = []
+    end = None
+    while end is None:
+        msg = pipe.recv()
+        now = time.monotonic()
+        if msg.kind == Event.TimerInitiated:
+            begin = now
+        elif msg.kind == Event.TimeChange:
+            ticks.append(now)
+        elif msg.kind == Event.TimerFinished:
+            end = now
+
+    process.join()
+    broker.unsuscribe(suscriber, events)
+    return begin, ticks, end
+
+def countdown_process(kind, broker, log_file, args):
+    clock = ScaledClock(args.speed)
+    if kind == "pomodoro":
+        loop = pomodoro(args.pomodoros, None, args.pomodoro_time, args.break_time, log_file, broker, None, clock=clock)
+    else:
+        loop = timer(args.pomodoros * args.pomodoro_time, None, log_file, args.pomodoro_time, broker, None, clock=clock)
+
+    run_loop(scaled_waits(loop, args.speed))
+
+def scaled_waits(loop, speed):
+    """The loop counts its timeouts on the scaled clock, the runtime waits them on the real one"""
+    reply = None
+    while True:
+        try:
+            request = loop.send(reply)
+        except StopIteration:
+            return
+
+        if isinstance(request, Wait) and request.timeout is not None:
+            request = Wait(request.pipes, request.fds, request.timeout / speed)
+        reply = yield request
+
+def session_plan(kind, args):
+    """Length of the session and the second each pomodoro ends, in session seconds"""
+    pomodoro_seconds = args.pomodoro_time * 60
+    if kind == "pomodoro":
+        break_seconds = args.break_time * 60
+        ends = [(index + 1) * pomodoro_seconds + index * break_seconds for index in range(args.pomodoros)]
+    else:
+        ends = [(index + 1) * pomodoro_seconds for index in range(args.pomodoros)]
+    return ends[-1], ends
+
+class LogWatcher:
+    """Notes when each new line shows up in the log, polling its size"""
+    def __init__(self, path, interval=0.0005):
+        self._path = path
+        self._interval = interval
+        self._arrivals = []
+        self._stopped = threading.Event()
+        self._thread = threading.Thread(target=self._watch, daemon=True)
+        self._thread.start()
+
+    def stop(self):
+        self._stopped.set()
+        self._thread.join()
+        return self._arrivals
+
+    def _watch(self):
+        size = 0
+        while not self._stopped.is_set():
+            current = os.stat(self._path).st_size
+            if current != size:
+                now = time.monotonic()
+                with open(self._path) as log:
+                    lines = sum(1 for line in log if line.strip())
+                self._arrivals.extend([now] * (lines - len(self._arrivals)))
+                size = current
+            time.sleep(self._interval)
+
+@contextmanager
+def load(broker, args):
+    """Processes that keep the CPU busy and flood the bus while the sessions run"""
+    stop = multiprocessing.Event()
+    processes = [multiprocessing.Process(target=cpu_load, args=(stop,)) for _ in range(args.cpu)]
+    if args.ipc:
+        processes.append(multiprocessing.Process(target=ipc_load, args=(broker, args.ipc, stop)))
+
+    for process in processes:
+        process.start()
+    try:
+        yield
+    finally:
+        stop.set()
+        for process in processes:
+            process.join()
+
+def cpu_load(stop):
+    while not stop.is_set():
+        sum(range(10000))
+
+def ipc_load(broker, rate, stop):
+    """Publishes App msgs at rate per second and drains them, like a printer would"""
+    suscriber = suscriber_id("load")
+    pipe = broker.suscribe(Event.App, suscriber=suscriber)
+    interval = 1 / rate
+    next_publish = time.monotonic()
+    while not stop.is_set():
+        broker.publish(EventMsg(Event.App, "carga"))
+        while pipe.poll():
+            pipe.recv()
+
+        next_publish += interval
+        time.sleep(max(0, next_publish - time.monotonic()))
+    broker.unsuscribe(suscriber, [Event.App])
+
+@contextmanager
+def broker_for(transport):
+    if transport == "manager":
+        EventBrokerManager.register("EventBroker", EventBroker)
+        with EventBrokerManager() as manager:
+            yield manager.EventBroker()
+    else:
+        broker = SharedMemoryEventBroker()
+        try:
+            yield broker
+        finally:
+            broker.shutdown()
+
+def percentiles(samples):
+    if not samples:
+        return {}
+
+    ordered = sorted(samples)
+    def at(fraction):
+        return ordered[min(len(ordered) - 1, int(fraction * len(ordered)))] * 1e3
+
+    return {
+        "p50": at(0.50),
+        "p90": at(0.90),
+        "p99": at(0.99),
+        "max": ordered[-1] * 1e3,
+        "mean": statistics.fmean(ordered) * 1e3,
+    }
+
+def print_report(result):
+    print("== {} | {} | {} sesiones a {}x | cpu {} | ipc {} eventos/s".format(
+        result["kind"], result["transport"], result["sessions"], result["speed"], result["cpu"], result["ipc"]))
+    for name in ["end_lateness_ms", "tick_jitter_ms", "log_lateness_ms"]:
+        values = result[name]
+        print("   {:<16} {}".format(name, "  ".join("{}={:.2f}".format(k, v) for k, v in values.items())))
+    print("   {:<16} {:.0f}".format("ticks", result["ticks_per_session"]))
+
+def _build_parser():
+    parser = argparse.ArgumentParser(description="Precisión de los temporizadores sobre el reloj real, con carga")
+    parser.add_argument(
+            "--kind",
+            choices=KINDS,
+            action="append",
+            help="Tipo de sesión a medir. Se puede repetir, por defecto se miden todos.")
+    parser.add_argument("--transport", choices=TRANSPORTS, default="manager", help="Transporte del bus de eventos.")
+    parser.add_argument("--sessions", type=int, default=3, help="Cantidad de sesiones a correr de cada tipo.")
+    parser.add_argument("--pomodoros", type=int, default=2, help="Pomodoros de cada sesión.")
+    parser.add_argument("--pomodoro-time", type=int, default=1, help="Minutos de cada pomodoro.")
+    parser.add_argument("--break-time", type=int, default=1, help="Minutos de cada descanso.")
+    parser.add_argument("--speed", type=float, default=60, help="Cuántas veces más rápido que el tiempo real corre la sesión.")
+    parser.add_argument("--cpu", type=int, default=0, help="Procesos que ocupan la CPU mientras tanto.")
+    parser.add_argument("--ipc", type=int, default=0, help="Eventos por segundo que otro proceso publica en el bus mientras tanto.")
+    parser.add_argument("--json", type=str, default=None, help="Archivo donde escribir los resultados en JSON.")
+
+    return parser
+
+if __name__ == "__main__":
+    main()
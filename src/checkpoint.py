@@ -0,0 +1,146 @@
+"""
+Checkpoint of the running session on a small mmap'd file, so the resume
+command can pick it up after the terminal died or the app was killed.
+
+The file has two slots written in turns, each one with a sequence number and
+a CRC of its content. A write cut halfway leaves a slot with a wrong CRC, so
+the reader takes the valid slot with the highest sequence. The kernel keeps
+the pages of the file when the process dies, so a tick costs a pack and a
+copy, without syscalls.
+
+Each session writes its own file, named after the process of its countdown,
+so sessions running at the same time don't write over each other. Only the
+checkpoints of sessions that are not running anymore can be resumed.
+"""
+
+from dataclasses import dataclass
+from glob import glob
+import mmap
+import os
+import struct
+import zlib
+
+from global_data import DATA_PATH
+from messages import process_alive
+from utils import file_path_in_home
+
+_HEADER = struct.Struct("<QI")
+# kind, on break, seconds, since last pomodoro, remaining, done, total, pomodoro time, break time, minutes, tag, purpose
+_FIELDS = struct.Struct("<BBiIdHHHHI64s192s")
+_SLOT = _HEADER.size + _FIELDS.size
+_KINDS = ("timer", "pomodoro")
+
+@dataclass(frozen=True)
+class Checkpoint:
+    kind : str # "timer" or "pomodoro"
+    seconds : int # as shown on the screen
+    remaining : float # exact seconds left on the phase
+    pomodoros_done : int
+    pomodoros_total : int
+    pomodoro_time : int
+    on_break : bool = False
+    since_last_pomodoro : int = 0
+    break_duration : int = 0
+    minutes_count : int = 0
+    tag : str = ""
+    purpose : str = ""
+    path : str = "" # file it was loaded from, not written
+
+class CheckpointFile:
+    def __init__(self, path):
+        """The checkpoint already there stays valid until this one writes over it"""
+        self._path = path
+        fd = os.open(path, os.O_RDWR | os.O_CREAT, 0o644)
+        try:
+            if os.fstat(fd).st_size < 2 * _SLOT:
+                os.ftruncate(fd, 2 * _SLOT)
+            self._mmap = mmap.mmap(fd, 2 * _SLOT)
+        finally:
+            os.close(fd)
+        self._sequence = max((sequence for sequence, _ in _valid_slots(self._mmap)), default=0)
+
+    def write(self, checkpoint):
+        self._sequence += 1
+        fields = _FIELDS.pack(
+                _KINDS.index(checkpoint.kind),
+                checkpoint.on_break,
+                checkpoint.seconds,
+                checkpoint.since_last_pomodoro,
+                checkpoint.remaining,
+                checkpoint.pomodoros_done,
+                checkpoint.pomodoros_total,
+                checkpoint.pomodoro_time,
+                checkpoint.break_duration,
+                checkpoint.minutes_count,
+                (checkpoint.tag or "").encode("utf-8"),
+                (checkpoint.purpose or "").encode("utf-8"))
+        offset = (self._sequence % 2) * _SLOT
+        self._mmap[offset:offset + _SLOT] = _HEADER.pack(self._sequence, zlib.crc32(fields)) + fields
+
+    def close(self, discard=False):
+        """The checkpoint of a session that ended is discarded, there is nothing to resume"""
+        self._mmap.close()
+        if discard:
+            discard_checkpoint(self._path)
+
+def create_checkpoint():
+    """The checkpoint of the session of this process"""
+    os.makedirs(file_path_in_home(DATA_PATH), exist_ok=True)
+    return CheckpointFile(_checkpoint_path(os.getpid()))
+
+def load_checkpoint():
+    """The last checkpoint left by a session that is not running, None if there is none to resume"""
+    latest = None
+    for path in glob(_checkpoint_path("*")):
+        pid = path.rsplit("_", 1)[-1]
+        if not pid.isdigit() or process_alive(int(pid)):
+            continue
+
+        try:
+            with open(path, "rb") as file:
+                data = file.read()
+            modified = os.stat(path).st_mtime
+        except FileNotFoundError:
+            continue
+
+        slot = max(_valid_slots(data), default=None)
+        if slot is not None and (latest is None or latest[0] < modified):
+            latest = (modified, path, slot[1])
+
+    if latest is None:
+        return None
+    return _checkpoint(*_FIELDS.unpack(latest[2]), path=latest[1])
+
+def discard_checkpoint(path):
+    """Another session may have taken it over already"""
+    try:
+        os.remove(path)
+    except FileNotFoundError:
+        pass
+
+def _valid_slots(data):
+    """Sequence and fields of the slots whose CRC matches"""
+    for offset in range(0, len(data) - _SLOT + 1, _SLOT):
+        sequence, crc = _HEADER.unpack_from(data, offset)
+        fields = bytes(data[offset + _HEADER.size:offset + _SLOT])
+        if sequence and zlib.crc32(fields) == crc:
+            yield sequence, fields
+
+def _checkpoint(kind, on_break, seconds, since_last, remaining, done, total, pomodoro_time, break_duration, minutes, tag, purpose, path=""):
+    return Checkpoint(
+            kind=_KINDS[kind],
+            seconds=seconds,
+            remaining=remaining,
+            pomodoros_done=done,
+            pomodoros_total=total,
+            pomodoro_time=pomodoro_time,
+            on_break=bool(on_break),
+            since_last_pomodoro=since_last,
+            break_duration=break_duration,
+            minutes_count=minutes,
+            tag=tag.rstrip(b"\0").decode("utf-8", errors="ignore"),
+            purpose=purpose.rstrip(b"\0").decode("utf-8", errors="ignore"),
+            path=path)
+
+def _checkpoint_path(pid):
+    return file_path_in_home(DATA_PATH, "checkpoint_{}".format(pid))
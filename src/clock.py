@@ -0,0 +1,38 @@
+"""
+Where the countdowns, the stopwatch and the audio read the time from. The app
+gives them SystemClock, while a VirtualClock driven by runtime.run_loop_virtual
+jumps to the next timeout instead of sleeping, so a whole session with its
+breaks, log writes and events runs in a moment.
+"""
+
+from datetime import datetime, timedelta
+import time
+
+class SystemClock:
+    def monotonic(self):
+        return time.monotonic()
+
+    def now(self):
+        return datetime.now()
+
+    def time(self):
+        return time.time()
+
+class VirtualClock:
+    def __init__(self, start=None):
+        self._start = start or datetime.now()
+        self._elapsed = 0.0
+
+    def monotonic(self):
+        return self._elapsed
+
+    def now(self):
+        return self._start + timedelta(seconds=self._elapsed)
+
+    def time(self):
+        return self.now().timestamp()
+
+    def advance(self, seconds):
+        self._elapsed += max(0, seconds)
+
+SYSTEM_CLOCK = SystemClock()
@@ -0,0 +1,49 @@
+"""
+Append-only trace of the msgs published on the event bus. After the header
+every record is the monotonic time of the publish, the length of the msg and
+the msg itself on its wire encoding.
+"""
+
+import os
+import struct
+import time
+
+_MAGIC = b"CPTR\x01"
+_RECORD = struct.Struct("<dI")
+
+class TraceWriter:
+    """
+    Writes each record with a single unbuffered write on a file opened for
+    appending, so processes sharing the writer after a fork don't interleave
+    their records.
+    """
+    def __init__(self, path):
+        self._fd = os.open(path, os.O_WRONLY | os.O_CREAT | os.O_TRUNC | os.O_APPEND, 0o644)
+        os.write(self._fd, _MAGIC)
+
+    def write(self, data):
+        os.write(self._fd, _RECORD.pack(time.monotonic(), len(data)) + data)
+
+    def close(self):
+        os.close(self._fd)
+
+def read_trace(path):
+    """Yields the (seconds since the first record, encoded msg) of the trace"""
+    with open(path, "rb") as trace:
+        if trace.read(len(_MAGIC)) != _MAGIC:
+            raise RuntimeError("El archivo {} no es una traza de cmd_pomodoro".format(path))
+
+        first = None
+        while True:
+            header = trace.read(_RECORD.size)
+            if len(header) < _RECORD.size:
+                return # the end, or a record cut by a crash
+
+            timestamp, length = _RECORD.unpack(header)
+            data = trace.read(length)
+            if len(data) < length:
+                return
+
+            if first is None:
+                first = timestamp
+            yield timestamp - first, data
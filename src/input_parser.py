@@ -1,10 +1,14 @@
 import argparse
 from configparser import ConfigParser
 import dataclasses as dc
+import os
+import shlex
 from shutil import copy as shcopy
 
 from utils import file_path_in_home  
 from global_data import CONFIGURATION_PATH, DATA_PATH
+from messages import Resolution
+from pomodoro_log import FSYNC_POLICIES
 
 def read_input():
     parser = _build_parser()
@@ -54,6 +58,12 @@ def process_config(args, file="config.ini"):
         can_pause_pomodoros = args.can_pause_pomodoros == "Y" 
         config_object[env]["can_pause_pomodoros"] = str(can_pause_pomodoros)
 
+    if args.display_resolution:
+        config_object[env]["display_resolution"] = args.display_resolution
+
+    if args.log_fsync:
+        config_object[env]["log_fsync"] = args.log_fsync
+
     if args.tag_add:
         tags = config_object.getlist(env, "tags") if config_object.has_option(env, "tags") else []
         tags_modified = False
@@ -99,6 +109,32 @@ def _build_parser():
             default=False,
             help="Se configuran los logs para imprimir más información relevante para debugging")
 
+    parser.add_argument(
+            "--log-level", 
+            action="append", 
+            default=[],
+            metavar="SUBSISTEMA=NIVEL",
+            help="Nivel de log para un subsistema, por ejemplo 'event_broker=WARNING' o 'printer=DEBUG'. Se puede repetir.")
+
+    parser.add_argument(
+            "--bus", 
+            choices=["manager", "shm"],
+            default="manager",
+            help="Transporte del bus de eventos entre procesos. 'manager' usa un proceso servidor y 'shm' un buffer circular en memoria compartida.")
+
+    parser.add_argument(
+            "--record", 
+            type=str, 
+            default=None,
+            metavar="ARCHIVO",
+            help="Guarda en el archivo una traza de todos los eventos publicados, para reproducirla luego con el comando replay.")
+
+    parser.add_argument(
+            "--single-process", 
+            action="store_true", 
+            default=False,
+            help="Corre todas las partes de la aplicación como tareas de asyncio en un único proceso en lugar de un proceso por cada una.")
+
     subparser = parser.add_subparsers(
             dest="cmd", 
             title="Comandos",
@@ -121,6 +157,13 @@ def _build_parser():
             type=str, 
             default=None,
             help="Intención u objetivo que se quiere cumplir en este pomodoro")
+    timer_parser.add_argument(
+            "-reminder", "-r", 
+            type=reminder, 
+            action="append",
+            default=[],
+            metavar="NOMBRE=MINUTOS",
+            help="Recordatorio con nombre que avisa pasados los minutos indicados, a la par del temporizador. Se puede repetir.")
 
     # pomodoro command
     pomodoro_parser = subparser.add_parser("pomodoro", help="Comienza tantos pomodoros como se pase por argumento.")
@@ -138,6 +181,48 @@ def _build_parser():
             type=str, 
             default=None,
             help="Intención u objetivo que se quiere cumplir en este pomodoro.")
+    pomodoro_parser.add_argument(
+            "-reminder", "-r", 
+            type=reminder, 
+            action="append",
+            default=[],
+            metavar="NOMBRE=MINUTOS",
+            help="Recordatorio con nombre que avisa pasados los minutos indicados, a la par del temporizador. Se puede repetir.")
+
+    # status command
+    subparser.add_parser("status", help="Muestra el estado del temporizador en curso, por ejemplo para una barra de estado.")
+
+    # resume command
+    subparser.add_parser("resume", help="Retoma la última sesión que no llegó a terminar, por ejemplo si se cerró la terminal.")
+
+    # agenda command
+    agenda_parser = subparser.add_parser("agenda", help="Corre varias sesiones de timer o pomodoro una detrás de otra, sin volver a iniciar el programa entre ellas.")
+    agenda_parser.add_argument(
+            "file", 
+            type=str, 
+            nargs="?",
+            default=None,
+            metavar="archivo",
+            help="Archivo con una sesión por línea, escrita como el comando que la iniciaría, por ejemplo 'pomodoro 2 -t programar'. Las líneas vacías y las que empiezan con # se ignoran.")
+    agenda_parser.add_argument(
+            "-session", "-s", 
+            action="append", 
+            default=[],
+            metavar="SESION",
+            help="Una sesión escrita como el comando que la iniciaría, entre comillas. Se puede repetir y va después de las del archivo.")
+
+    # replay command
+    replay_parser = subparser.add_parser("replay", help="Reproduce en pantalla una traza grabada con --record, sin temporizador ni sonidos.")
+    replay_parser.add_argument(
+            "file", 
+            type=str, 
+            metavar="archivo",
+            help="Traza a reproducir.")
+    replay_parser.add_argument(
+            "-speed", "-s", 
+            type=float, 
+            default=1.0,
+            help="Velocidad de reproducción. 1 es tiempo real, 10 es diez veces más rápido y 0 lo más rápido posible.")
 
     # config command
     config_parser = subparser.add_parser(
@@ -178,6 +263,14 @@ def _build_parser():
             type=str, 
             metavar="can_pause_pomodoros",
             help="Indica si los pomodoros pueden ser pausados una vez comenzados. Los valores para esta opción son 'Y' o 'N'.")
+    config_parser.add_argument(
+            "-display_resolution", 
+            choices=[resolution.name.lower() for resolution in Resolution],
+            help="Con qué detalle se muestra en pantalla el tiempo restante. La pantalla sólo se actualiza cuando cambia lo que muestra, por defecto 'seconds'.")
+    config_parser.add_argument(
+            "-log_fsync", 
+            choices=FSYNC_POLICIES,
+            help="Cuándo se fuerza a disco el archivo de pomodoros: 'never' lo deja en manos del sistema, 'close' al terminar y 'always' con cada pomodoro. Por defecto 'never'.")
     config_parser.add_argument(
             "-tag_add", 
             type=str, 
@@ -194,6 +287,28 @@ def _build_parser():
     
     return parser
 
+def read_agenda(args):
+    """The sessions of the agenda, each parsed by the timer or pomodoro command it is written as"""
+    parser = _build_parser()
+
+    specs = []
+    if args.file:
+        with open(os.path.expanduser(args.file)) as plan:
+            specs.extend(line.strip() for line in plan if line.strip() and not line.strip().startswith("#"))
+    specs.extend(args.session)
+
+    if not specs:
+        parser.error("La agenda no tiene ninguna sesión")
+
+    sessions = []
+    for spec in specs:
+        session = parser.parse_args(shlex.split(spec))
+        if session.cmd not in ("timer", "pomodoro"):
+            parser.error("La sesión '{}' de la agenda no es un timer ni un pomodoro".format(spec))
+        sessions.append(session)
+
+    return sessions
+
 def copy_file_to_local_data(src_path, dst_name):
     return shcopy(file_path_in_home(src_path), file_path_in_home(DATA_PATH, dst_name))
 
@@ -211,6 +326,13 @@ def _read_config_file(args, file):
 
     return config
 
+def reminder(string):
+    """Turns "agua=20" into ("agua", 20)"""
+    name, _, minutes = string.partition("=")
+    if not name.strip() or not minutes.strip().isdigit() or int(minutes) <= 0:
+        raise argparse.ArgumentTypeError("Recordatorio {} inválido, se espera NOMBRE=MINUTOS".format(string))
+    return name.strip(), int(minutes)
+
 def read_list(string):
     return [i.strip() for i in string.split(',')] if len(string) > 0 else []
 
@@ -232,7 +354,9 @@ def _build_config(config_map):
             audio_pomodoro_break_finish= config_map["audio_pomodoro_break_finish"],
             path_to_log= config_map["path_to_log"],
             can_pause_pomodoros= config_map.getboolean("can_pause_pomodoros"),
-            tags= config_map.getlist("tags")
+            tags= config_map.getlist("tags"),
+            display_resolution= Resolution[config_map.get("display_resolution", "seconds").capitalize()],
+            log_fsync= config_map.get("log_fsync", "never")
             )
 
 @dc.dataclass(frozen=True)
@@ -245,3 +369,5 @@ class Config:
     path_to_log : str
     can_pause_pomodoros : bool
     tags : list[str]
+    display_resolution : Resolution = Resolution.Seconds
+    log_fsync : str = "never"
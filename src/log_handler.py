@@ -0,0 +1,84 @@
+from collections import deque
+import logging
+from multiprocessing import util
+import threading
+
+class RingBufferHandler(logging.Handler):
+    """
+    Keeps the records on memory and a background thread formats and appends
+    them to the file, so logging on a hot path costs an append to a deque.
+    When the buffer fills up the oldest records are lost and a line on the
+    file tells how many.
+
+    Every process forked by multiprocessing restarts its own flush thread
+    and flushes what is left when it exits.
+    """
+    def __init__(self, filename, capacity=10000, interval=0.5):
+        super().__init__()
+        self._filename = filename
+        self._interval = interval
+        self._records = deque(maxlen=capacity)
+        self._lost = 0
+        self._wakeup = threading.Event()
+        self._flush_lock = threading.Lock()
+        self._start()
+
+        util.register_after_fork(self, RingBufferHandler._after_fork)
+
+    def emit(self, record):
+        if len(self._records) == self._records.maxlen:
+            self._lost += 1
+        self._records.append(record)
+
+        if logging.WARNING <= record.levelno or self._records.maxlen // 2 <= len(self._records):
+            self._wakeup.set()
+
+    def flush(self):
+        with self._flush_lock:
+            lines = []
+            while self._records:
+                record = self._records.popleft()
+                try:
+                    lines.append(self.format(record))
+                except Exception:
+                    self.handleError(record)
+
+            if self._lost:
+                lines.append("{} log records lost, the buffer was full".format(self._lost))
+                self._lost = 0
+
+            if lines:
+                with open(self._filename, "a") as file:
+                    file.write("\n".join(lines) + "\n")
+
+    def close(self):
+        self.flush()
+        super().close()
+
+    def _start(self):
+        threading.Thread(target=self._flush_periodically, name="log_flusher", daemon=True).start()
+
+    def _flush_periodically(self):
+        while True:
+            self._wakeup.wait(self._interval)
+            self._wakeup.clear()
+            self.flush()
+
+    def _after_fork(self):
+        # The records of the parent are written by the parent
+        self._records.clear()
+        self._lost = 0
+        self._flush_lock = threading.Lock()
+        self._start()
+        util.Finalize(self, self.flush, exitpriority=0)
+
+def parse_levels(levels):
+    """Turns ["printer=DEBUG", "event_broker=WARNING"] into {".printer": 10, ".event_broker": 30}"""
+    parsed = {}
+    for level in levels or []:
+        subsystem, _, name = level.partition("=")
+        value = logging.getLevelName(name.strip().upper())
+        if not subsystem or not isinstance(value, int):
+            raise RuntimeError("Nivel de log {} inválido, se espera subsistema=NIVEL".format(level))
+        parsed["." + subsystem.strip().lstrip(".")] = value
+    return parsed
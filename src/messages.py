@@ -1,11 +1,23 @@
+from collections import deque, OrderedDict
 from enum import auto, Enum
-from dataclasses import dataclass
+from dataclasses import dataclass, field
+import fcntl
 import logging
+import math
+import os
 import queue
+import select
+import selectors
+import struct
+import termios
+import threading
+import time
 from multiprocessing.managers import BaseManager
 from multiprocessing import Pipe
 from os import getpid
 
+from event_trace import TraceWriter
+
 class Event(Enum):
     TimeChange = auto()
     App = auto()
@@ -35,12 +47,36 @@ class Event(Enum):
     PurposeAdded = auto()
     PurposeSetted = auto()
     LayoutDraw = auto()
+    # No longer published, it keeps its value for the traces recorded with it
     StopStopwatch = auto()
     StopPrinter = auto()
     TagSetted = auto()
     TagChange = auto()
     TagChanged = auto()
     TagFinished = auto()
+    Snapshot = auto()
+    CancelTimer = auto()
+    FocusNext = auto()
+    SessionBegin = auto()
+    StopwatchStarted = auto()
+    StopwatchLap = auto()
+    StopwatchStopped = auto()
+
+class Phase(Enum):
+    Timer = auto()
+    Pomodoro = auto()
+    Break = auto()
+
+class Resolution(Enum):
+    """Smallest step of the time left shown on the screen, in seconds"""
+    Hours = 3600
+    Minutes = 60
+    Seconds = 1
+    Tenths = 0.1
+
+    def units_left(self, seconds):
+        """Units of the resolution left, rounded up like the screen shows them"""
+        return math.ceil(round(seconds / self.value, 6))
 
 @dataclass(frozen=True)
 class EventMsg():
@@ -50,52 +86,580 @@ class EventMsg():
     def __str__(self):
         return "kind: {}, msg: {}".format(self.kind, self.msg)
 
+# Wire format of an EventMsg: kind, payload type and length of the body
+# followed by the body. Strings travel as UTF-8, ints as 8 bytes and tuples as
+# a sequence of typed values.
+_WIRE_HEADER = struct.Struct("<BBI")
+_VALUE_HEADER = struct.Struct("<BI")
+_INT = struct.Struct("<q")
+_NONE, _STR, _INT_TYPE, _TUPLE, _MSG = range(5)
+_EVENTS_BY_VALUE = {event.value: event for event in Event}
+
+def encode(msg: EventMsg) -> bytes:
+    payload_type, body = _encode_value(msg.msg)
+    return _WIRE_HEADER.pack(msg.kind.value, payload_type, len(body)) + body
+
+def decode(data) -> EventMsg:
+    kind, payload_type, length = _WIRE_HEADER.unpack_from(data, 0)
+    body = data[_WIRE_HEADER.size:_WIRE_HEADER.size + length]
+    return EventMsg(_EVENTS_BY_VALUE[kind], _decode_value(payload_type, body))
+
+def peek_kind(data) -> Event:
+    """Kind of an encoded msg without decoding its body"""
+    return _EVENTS_BY_VALUE[data[0]]
+
+def _encode_value(value):
+    match value:
+        case None:
+            return _NONE, b""
+        case str():
+            return _STR, value.encode("utf-8")
+        case int():
+            return _INT_TYPE, _INT.pack(value)
+        case EventMsg():
+            return _MSG, encode(value)
+        case tuple() | list():
+            items = []
+            for item in value:
+                item_type, item_body = _encode_value(item)
+                items.append(_VALUE_HEADER.pack(item_type, len(item_body)) + item_body)
+            return _TUPLE, b"".join(items)
+        case _:
+            raise RuntimeError("Value {} can't be encoded on an EventMsg".format(value))
+
+def _decode_value(value_type, body):
+    if value_type == _NONE:
+        return None
+    if value_type == _STR:
+        return bytes(body).decode("utf-8")
+    if value_type == _INT_TYPE:
+        return _INT.unpack(body)[0]
+    if value_type == _MSG:
+        return decode(body)
+
+    items = []
+    offset = 0
+    while offset < len(body):
+        item_type, length = _VALUE_HEADER.unpack_from(body, offset)
+        offset += _VALUE_HEADER.size
+        items.append(_decode_value(item_type, body[offset:offset + length]))
+        offset += length
+    return tuple(items)
+
 class EventBrokerManager(BaseManager):
     pass
 
+# Events whose last value is enough to know the state of the session. Events
+# on the same group overwrite each other.
+_STICKY_EVENTS = {
+    Event.TimerInit: "mode",
+    Event.PomodoroInit: "mode",
+    Event.PomodoroSetted: "pomodoros",
+    Event.TimerInitiated: "end_time",
+    Event.TimerResumed: "end_time",
+    Event.TimerStopped: "paused",
+    Event.TagSetted: "tag",
+    Event.TagChanged: "tag",
+    Event.PurposeSetted: "purpose",
+    Event.PurposeAdded: "purpose",
+    Event.PomodoroBegin: "phase",
+    Event.BreakBegin: "phase",
+    Event.BreakFinished: "phase",
+    Event.TimeChange: "time",
+    Event.PrinterReady: "printer",
+    Event.AudioPlayback: "audio",
+    Event.AudioStopped: "audio",
+    Event.SessionBegin: "session",
+}
+
+# Sticky groups that belong to a single session of an agenda
+_SESSION_GROUPS = {"pomodoros", "end_time", "paused", "tag", "purpose", "phase", "time"}
+
+# Events that only matter by how many times they happened
+_COUNTED_EVENTS = {Event.PomodoroFinished}
+
+class RetainedState:
+    """
+    Compact view of every msg published so far. Keeps the last msg of each
+    sticky group, a counter for counted events and a bounded window with the
+    most recent of the rest, so its size doesn't grow with the session length.
+    """
+    def __init__(self, history_size=64):
+        self._sequence = 0
+        self._sticky = {}
+        self._counters = {}
+        self._history = deque(maxlen=history_size)
+
+    def retain(self, msg):
+        self._sequence += 1
+
+        if msg.kind == Event.SessionBegin:
+            # What the previous session left behind doesn't hold for the next one
+            self._counters.clear()
+            self._sticky = {group: entry for group, entry in self._sticky.items() if group not in _SESSION_GROUPS}
+
+        if msg.kind in _STICKY_EVENTS:
+            self._sticky[_STICKY_EVENTS[msg.kind]] = (self._sequence, msg)
+        elif msg.kind in _COUNTED_EVENTS:
+            _, count = self._counters.get(msg.kind, (0, 0))
+            self._counters[msg.kind] = (self._sequence, count + 1)
+        else:
+            self._history.append((self._sequence, msg))
+
+    def snapshot(self, events):
+        """The retained msgs of the given events in the order they were published"""
+        retained = [(sequence, msg) for sequence, msg in self._sticky.values() if msg.kind in events]
+        for kind, (sequence, count) in self._counters.items():
+            if kind in events:
+                retained.extend((sequence, EventMsg(kind)) for _ in range(count))
+        retained.extend((sequence, msg) for sequence, msg in self._history if msg.kind in events)
+
+        retained.sort(key=lambda entry: entry[0])
+        return tuple(msg for _, msg in retained)
+
+class BusMetrics:
+    """
+    Counters of the traffic going through a broker. Publish latencies are kept
+    on a histogram of power of two microsecond buckets so recording one is O(1).
+    """
+    def __init__(self):
+        self._published = {}
+        self._delivered = {}
+        self._dropped = {}
+        self._pruned = {}
+        self._bytes_sent = 0
+        self._latency_buckets = {}
+
+    def published(self, msg, latency):
+        self._published[msg.kind] = self._published.get(msg.kind, 0) + 1
+
+        bucket = int(latency * 1e6).bit_length()
+        self._latency_buckets[bucket] = self._latency_buckets.get(bucket, 0) + 1
+
+    def delivered(self, suscriber, data):
+        self._delivered[suscriber] = self._delivered.get(suscriber, 0) + 1
+        self._bytes_sent += len(data)
+
+    def dropped(self, suscriber):
+        self._dropped[suscriber] = self._dropped.get(suscriber, 0) + 1
+
+    def pruned(self, suscriber):
+        self._pruned[suscriber] = self._pruned.get(suscriber, 0) + 1
+
+    def report(self, pending=None, queued=None):
+        """Plain data, so it can travel through the manager proxy"""
+        return {
+            "published": {kind.name: count for kind, count in self._published.items()},
+            "delivered": {str(suscriber): count for suscriber, count in self._delivered.items()},
+            "dropped": {str(suscriber): count for suscriber, count in self._dropped.items()},
+            "pruned": {str(suscriber): count for suscriber, count in self._pruned.items()},
+            "bytes_sent": self._bytes_sent,
+            "queued": {str(suscriber): count for suscriber, count in (queued or {}).items()},
+            "pending": {str(suscriber): count for suscriber, count in (pending or {}).items()},
+            "publish_latency_us": {
+                "<{}".format(1 << bucket): count for bucket, count in sorted(self._latency_buckets.items())},
+        }
+
+def format_metrics(metrics):
+    lines = ["Event bus metrics. {} bytes sent".format(metrics["bytes_sent"])]
+    for title in ["published", "delivered", "dropped", "pruned", "queued", "pending", "publish_latency_us"]:
+        values = metrics[title]
+        lines.append("  {}: {}".format(title, ", ".join("{}={}".format(k, v) for k, v in values.items()) or "-"))
+    return "\n".join(lines)
+
+def pending_bytes(connection):
+    """Estimate of what the kernel holds on the pipe waiting for the other end to read it"""
+    try:
+        (count,) = struct.unpack("i", fcntl.ioctl(connection.fileno(), termios.TIOCOUTQ, b"\0" * 4))
+        return count
+    except OSError:
+        return None
+
+class EventPipe:
+    """Suscriber end of the broker. Unfolds the snapshots into the msgs they carry."""
+    def __init__(self, connection):
+        self._connection = connection
+        self._pending = deque()
+
+    def poll(self, timeout=0.0):
+        return len(self._pending) != 0 or self._connection.poll(timeout)
+
+    def fileno(self):
+        return self._connection.fileno()
+
+    def recv(self):
+        while not self._pending:
+            msg = decode(self._connection.recv_bytes())
+            if msg.kind != Event.Snapshot:
+                return msg
+            self._pending.extend(msg.msg)
+
+        return self._pending.popleft()
+
+class QueuePolicy(Enum):
+    """What the broker does with the msgs of a suscriber that doesn't keep up"""
+    Block = auto() # the publisher waits for room on the queue
+    DropOldest = auto() # the oldest queued msg is discarded
+    Coalesce = auto() # a queued msg of a sticky event is replaced by the newer one, otherwise as DropOldest
+
+_OUTBOX_CAPACITY = 256
+_FLUSH_BUDGET = 32 * 1024
+_LIVENESS_INTERVAL = 5
+_PIPE_MSG_OVERHEAD = 1024 # what the kernel accounts for each msg besides its payload
+
+@dataclass
+class Subscription:
+    handle : int
+    suscriber : object
+    pipe : object
+    events : set
+    policy : QueuePolicy = QueuePolicy.Block
+    capacity : int = _OUTBOX_CAPACITY
+    outbox : OrderedDict = field(default_factory=OrderedDict)
+    room : object = None # poll object telling if the pipe can take more msgs
+
 class EventBroker:
+    """
+    Subscriptions are indexed by handle, by suscriber id and by event so that
+    publishing and unsuscribing never scan the whole list of suscribers.
+
+    A msg goes straight to the pipe of a suscriber when it has room for it,
+    otherwise it waits on the outbox of the subscription for a flusher thread
+    to send it. A suscriber that stops reading only fills its own outbox and
+    its policy decides what happens then.
+
+    The manager serves each client process from its own thread, hence the lock.
+    """
     def __init__(self):
         self._logger = logging.getLogger(".event_broker")
 
         self._msg_queue = queue.Queue()
-        self._event_consumers = {event:[] for event in Event}
-        self._msgs = []
+        self._lock = threading.RLock()
+        self._next_handle = 0
+        self._subscriptions = {}
+        self._handles_by_suscriber = {}
+        self._event_consumers = {event:{} for event in Event}
+        self._retained = RetainedState()
+        self._metrics = BusMetrics()
+        self._trace = None
+
+        self._room = threading.Condition(self._lock)
+        self._next_entry = 0
+        self._flusher = None
+        self._wakeup_fd, self._wakeup_signal = os.pipe()
+        os.set_blocking(self._wakeup_signal, False)
+
+    def suscribe(self, *events, suscriber, policy=QueuePolicy.Block, capacity=_OUTBOX_CAPACITY):
+        with self._lock:
+            return self._suscribe(events, suscriber, policy, capacity)
+
+    def suscribe_many(self, *events, suscribers, policy=QueuePolicy.Block, capacity=_OUTBOX_CAPACITY):
+        """Suscribes every suscriber to the events. Returns their pipes in the same order"""
+        with self._lock:
+            return [self._suscribe(events, suscriber, policy, capacity) for suscriber in suscribers]
 
-    def suscribe(self, *events, suscriber):
-        (ours, theirs) = Pipe()
+    def publish(self, msg: EventMsg):
+        with self._lock:
+            begin = time.perf_counter()
+            self._retained.retain(msg)
+
+            data = encode(msg)
+            if self._trace:
+                self._trace.write(data)
+
+            for subscription in list(self._event_consumers[msg.kind].values()):
+                self._enqueue(subscription, msg, data)
+
+            self._metrics.published(msg, time.perf_counter() - begin)
+
+    def publish_many(self, msgs):
+        """Publishes a burst of msgs in order on a single call to the broker"""
+        with self._lock:
+            for msg in msgs:
+                self.publish(msg)
+
+    def unsuscribe(self, suscriber_id, event_list=None):
+        """Removes the suscriber from the events. From all of them if none is given"""
+        with self._lock:
+            self._unsuscribe(suscriber_id, event_list)
+
+    def unsuscribe_many(self, suscriber_ids, event_list=None):
+        with self._lock:
+            for suscriber_id in suscriber_ids:
+                self._unsuscribe(suscriber_id, event_list)
+
+    def record(self, path):
+        """From now on every msg published is appended to the trace on the path"""
+        with self._lock:
+            self._trace = TraceWriter(path)
+
+    def metrics(self):
+        """Counters of the traffic so far, see BusMetrics"""
+        with self._lock:
+            pending = {}
+            queued = {}
+            for subscription in self._subscriptions.values():
+                pending[subscription.suscriber] = pending.get(subscription.suscriber, 0) + (pending_bytes(subscription.pipe) or 0)
+                queued[subscription.suscriber] = queued.get(subscription.suscriber, 0) + len(subscription.outbox)
+            return self._metrics.report(pending, queued)
+
+    def _suscribe(self, events, suscriber, policy, capacity):
         for event in events:
-            if event in self._event_consumers.keys():
-                self._logger.debug("Process {} suscribed to event {}".format(getpid(),event))
-                self._event_consumers[event].append((ours, suscriber))
-            else:
+            if event not in self._event_consumers.keys():
                 raise RuntimeError("Event {} is not a valid event".format(event))
 
-        self._publish_previous_msgs(ours, suscriber, events)
-        return theirs
-
-    def publish(self, msg: EventMsg):
-        self._msgs.append(msg)
-
-        for consumer, consumer_id in self._event_consumers[msg.kind]:
-            self._publish_msg_to_consumer(msg, consumer, consumer_id)
+        (ours, theirs) = Pipe()
+        subscription = Subscription(self._next_handle, suscriber, ours, set(events), policy, capacity)
+        subscription.room = select.poll()
+        subscription.room.register(ours.fileno(), select.POLLOUT)
+        self._next_handle += 1
+
+        self._subscriptions[subscription.handle] = subscription
+        self._handles_by_suscriber.setdefault(suscriber, set()).add(subscription.handle)
+        for event in subscription.events:
+            self._logger.debug("Suscriber %s suscribed to event %s", suscriber, event)
+            self._event_consumers[event][subscription.handle] = subscription
+
+        self._publish_snapshot(subscription)
+        self._wake_flusher() # to watch the new pipe
+        return EventPipe(theirs)
+
+    def _unsuscribe(self, suscriber_id, event_list):
+        for handle in list(self._handles_by_suscriber.get(suscriber_id, ())):
+            subscription = self._subscriptions[handle]
+            events = subscription.events.copy() if event_list is None else subscription.events.intersection(event_list)
+
+            for event in events:
+                del self._event_consumers[event][handle]
+                self._logger.debug("deleted consumer %s from event %s", suscriber_id, event)
+            subscription.events.difference_update(events)
+
+            if not subscription.events:
+                self._drop(subscription)
+
+    def _drop(self, subscription):
+        del self._subscriptions[subscription.handle]
+        handles = self._handles_by_suscriber[subscription.suscriber]
+        handles.discard(subscription.handle)
+        if not handles:
+            del self._handles_by_suscriber[subscription.suscriber]
+        subscription.outbox.clear()
+        subscription.pipe.close()
+        self._room.notify_all()
+
+    def _publish_snapshot(self, subscription):
+        msgs = self._retained.snapshot(subscription.events)
+        if msgs:
+            begin = time.perf_counter()
+            snapshot = EventMsg(Event.Snapshot, msgs)
+            self._enqueue(subscription, snapshot, encode(snapshot))
+            self._metrics.published(snapshot, time.perf_counter() - begin)
+
+    def _enqueue(self, subscription, msg, data):
+        outbox = subscription.outbox
+        if not outbox and subscription.room.poll(0):
+            self._send(subscription, msg, data)
+            return
+
+        if subscription.policy == QueuePolicy.Coalesce and msg.kind in _STICKY_EVENTS:
+            key = msg.kind
+            if outbox.pop(key, None) is not None:
+                self._metrics.dropped(subscription.suscriber)
+        else:
+            key = self._next_entry
+            self._next_entry += 1
+
+        while subscription.capacity <= len(outbox):
+            if subscription.policy != QueuePolicy.Block:
+                outbox.popitem(last=False)
+                self._metrics.dropped(subscription.suscriber)
+                continue
+
+            self._start_flusher()
+            self._room.wait()
+            if subscription.handle not in self._subscriptions:
+                return
+
+        if not outbox:
+            self._wake_flusher()
+        outbox[key] = (msg, data)
+
+    def _start_flusher(self):
+        if self._flusher is None:
+            self._flusher = threading.Thread(target=self._flush_outboxes, name="event_broker_flusher", daemon=True)
+            self._flusher.start()
+
+    def _wake_flusher(self):
+        self._start_flusher()
+        try:
+            os.write(self._wakeup_signal, b"\0")
+        except BlockingIOError:
+            pass # already woken
+
+    def _flush_outboxes(self):
+        """
+        Sends the queued msgs to every pipe that has room for them. Suscribers
+        never write on their pipe, so a readable one means the other end was
+        closed. Every now and then the processes of the suscribers are checked
+        too, in case their end of the pipe outlived them on another process.
+        """
+        next_check = time.monotonic() + _LIVENESS_INTERVAL
+        while True:
+            with selectors.DefaultSelector() as selector:
+                selector.register(self._wakeup_fd, selectors.EVENT_READ)
+                with self._lock:
+                    for handle, subscription in self._subscriptions.items():
+                        events = selectors.EVENT_READ | (selectors.EVENT_WRITE if subscription.outbox else 0)
+                        selector.register(subscription.pipe.fileno(), events, handle)
+
+                ready = selector.select(max(0, next_check - time.monotonic()))
+
+            with self._lock:
+                for key, mask in ready:
+                    if key.fd == self._wakeup_fd:
+                        os.read(self._wakeup_fd, 4096)
+                        continue
+
+                    subscription = self._subscriptions.get(key.data)
+                    if subscription is None:
+                        continue
+
+                    if mask & selectors.EVENT_READ:
+                        self._prune(subscription, "its pipe was closed")
+                    elif subscription.outbox:
+                        self._flush(subscription)
+
+                if next_check <= time.monotonic():
+                    self._prune_dead_processes()
+                    next_check = time.monotonic() + _LIVENESS_INTERVAL
+
+                self._room.notify_all()
+
+    def _prune_dead_processes(self):
+        for subscription in list(self._subscriptions.values()):
+            pid = _pid_of(subscription.suscriber)
+            if pid is not None and not process_alive(pid):
+                self._prune(subscription, "its process {} is gone".format(pid))
+
+    def _prune(self, subscription, reason):
+        """Drops a subscription whose suscriber can't read it anymore"""
+        self._logger.warning("Dropping suscriber %s, %s", subscription.suscriber, reason)
+        self._metrics.pruned(subscription.suscriber)
+
+        for event in subscription.events:
+            del self._event_consumers[event][subscription.handle]
+        subscription.events.clear()
+        self._drop(subscription)
+
+    def _flush(self, subscription):
+        """
+        A writable pipe has room for a fraction of its socket buffer, so only
+        up to a budget of bytes is sent to it before checking it again.
+        """
+        budget = _FLUSH_BUDGET
+        while subscription.outbox and 0 < budget:
+            _, (msg, data) = subscription.outbox.popitem(last=False)
+            self._send(subscription, msg, data)
+            budget -= len(data) + _PIPE_MSG_OVERHEAD
+
+    def _send(self, subscription, msg, data):
+        try:
+            self._publish_msg_to_consumer(msg, data, subscription.pipe, subscription.suscriber)
+        except OSError as error:
+            self._prune(subscription, "its pipe failed: {}".format(error))
+
+    def _publish_msg_to_consumer(self, msg, data, consumer, consumer_id):
+        consumer.send_bytes(data)
+        self._metrics.delivered(consumer_id, data)
+        self._logger.debug("Process %s has a new msg in it's pipe. msg: %s", consumer_id, msg)
+
+class EventBatch:
+    """
+    Collects the msgs published inside the block and ships them to the broker
+    on a single publish_many call when it exits. Can be used in place of the
+    broker with any of the helpers below.
+
+        with EventBatch(msg_queue) as batch:
+            event_pomodoro_finished(batch)
+            event_break_begin(batch)
+    """
+    def __init__(self, msg_queue):
+        self._msg_queue = msg_queue
+        self._msgs = []
 
-    def unsuscribe(self, suscriber_id, event_list):
-        for event in event_list:
-            for index, (_, theirs_id) in enumerate(self._event_consumers[event]):
-                if theirs_id == suscriber_id:
-                    self._event_consumers[event].pop(index)
-                    self._logger.debug("deleted consumer {} from event {}".format(suscriber_id, event))
+    def __enter__(self):
+        return self
 
-    def _publish_previous_msgs(self, topic, consumer_id, events):
-        for msg in filter(lambda msg: msg.kind in events, self._msgs):
-            self._publish_msg_to_consumer(msg, topic, consumer_id)
+    def __exit__(self, exc_type, exc_value, traceback):
+        if exc_type is None:
+            self.flush()
 
-    def _publish_msg_to_consumer(self, msg, consumer, consumer_id):
-        consumer.send(msg)
-        self._logger.debug("Process {} has a new msg in it's pipe. msg: {}".format(consumer_id, msg))
+    def publish(self, msg: EventMsg):
+        self._msgs.append(msg)
 
-def print_time(msg_queue, time):
-    _send(msg_queue, EventMsg(Event.TimeChange, time))
+    def flush(self):
+        if self._msgs:
+            self._msg_queue.publish_many(self._msgs)
+            self._msgs = []
+
+def _pid_of(suscriber):
+    """Process of a suscriber id, if it has one"""
+    match suscriber:
+        case (int() as pid, _):
+            return pid
+        case int():
+            return suscriber
+        case _:
+            return None
+
+def process_alive(pid):
+    try:
+        os.kill(pid, 0)
+    except ProcessLookupError:
+        return False
+    except PermissionError:
+        return True
+
+    try:
+        with open("/proc/{}/stat".format(pid)) as stat:
+            return stat.read().rsplit(")", 1)[1].split()[0] != "Z" # exited, waiting to be reaped
+    except (OSError, IndexError):
+        return True
+
+def suscriber_id(name):
+    """
+    Identifies a suscriber on the broker. The name tells apart the suscribers
+    sharing a process when running with the single process runtime.
+    """
+    return (getpid(), name)
+
+def wait(pipes=(), fds=(), timeout=None):
+    """
+    Blocks until a msg arrives on any of the pipes, any of the fds can be read
+    or the timeout (in seconds) expires. Returns the pipes and fds that are
+    ready, an empty list on timeout.
+    """
+    deadline = None if timeout is None else time.monotonic() + timeout
+    with selectors.DefaultSelector() as selector:
+        for fileobj in [*pipes, *fds]:
+            selector.register(fileobj, selectors.EVENT_READ)
+
+        while True:
+            # msgs already pulled from the pipe don't make its fd readable
+            ready = [pipe for pipe in pipes if pipe.poll()]
+
+            remaining = None if deadline is None else max(0, deadline - time.monotonic())
+            if ready:
+                remaining = 0
+
+            ready += [key.fileobj for key, _ in selector.select(remaining) if key.fileobj not in ready]
+
+            if ready or (deadline is not None and deadline <= time.monotonic()):
+                return ready
+
+def print_time(msg_queue, units, phase, name="", paused=False):
+    """Tick of the focused countdown: units of the display resolution left on the phase, its name and if it is paused"""
+    _send(msg_queue, EventMsg(Event.TimeChange, (units, phase.value, name, int(paused))))
 
 def print_app_msg(msg_queue, msg):
     _send(msg_queue, EventMsg(Event.App, msg))
@@ -130,6 +694,10 @@ def event_pomodoro_setted(msg_queue, pomodoros):
 def event_pomodoro_finished(msg_queue):
     _send(msg_queue, EventMsg(Event.PomodoroFinished))
 
+def event_session_begin(msg_queue, number, total):
+    """Next session of an agenda, as "number/total" """
+    _send(msg_queue, EventMsg(Event.SessionBegin, "{}/{}".format(number, total)))
+
 def event_pomodoro_init(msg_queue):
     _send(msg_queue, EventMsg(Event.PomodoroInit))
 
@@ -154,11 +722,17 @@ def event_timer_finished(msg_queue):
 def event_audio_ended(msg_queue):
     _send(msg_queue, EventMsg(Event.AudioEnded))
 
-def event_resume_timer(msg_queue):
-    _send(msg_queue, EventMsg(Event.ResumeTimer))
+def event_resume_timer(msg_queue, name=""):
+    _send(msg_queue, EventMsg(Event.ResumeTimer, name))
+
+def event_stop_timer(msg_queue, name=""):
+    _send(msg_queue, EventMsg(Event.StopTimer, name))
+
+def event_cancel_timer(msg_queue, name):
+    _send(msg_queue, EventMsg(Event.CancelTimer, name))
 
-def event_stop_timer(msg_queue):
-    _send(msg_queue, EventMsg(Event.StopTimer))
+def event_focus_next(msg_queue):
+    _send(msg_queue, EventMsg(Event.FocusNext))
 
 def event_audio_terminate(msg_queue):
     _send(msg_queue, EventMsg(Event.AudioTerminate))
@@ -178,8 +752,14 @@ def event_purpose_setted(msg_queue, purpose):
 def event_layout_draw(msg_queue):
     _send(msg_queue, EventMsg(Event.LayoutDraw))
 
-def event_stop_stopwatch(msg_queue):
-    _send(msg_queue, EventMsg(Event.StopStopwatch))
+def event_stopwatch_started(msg_queue):
+    _send(msg_queue, EventMsg(Event.StopwatchStarted))
+
+def event_stopwatch_lap(msg_queue, number, split_ms, lap_ms):
+    _send(msg_queue, EventMsg(Event.StopwatchLap, (number, split_ms, lap_ms)))
+
+def event_stopwatch_stopped(msg_queue, elapsed_ms, laps):
+    _send(msg_queue, EventMsg(Event.StopwatchStopped, (elapsed_ms, laps)))
 
 def event_stop_printer(msg_queue):
     _send(msg_queue, EventMsg(Event.StopPrinter))
@@ -0,0 +1,114 @@
+"""
+The file where the finished pomodoros are written.
+
+It usually lives on a synced folder, where opening or writing can take a
+while, so a thread of its own keeps it open and writes the entries the
+countdowns leave on a bounded queue. The countdowns never wait on the disk,
+and the loop hosting them closes the log from a Blocking request.
+"""
+
+import logging
+import os
+import queue
+import statistics
+import threading
+import time
+
+from utils import path_to_file
+
+# When the entries are forced to the disk: never, once when closing, after every write
+FSYNC_POLICIES = ["never", "close", "always"]
+
+_CLOSE = object()
+
+class PomodoroLog:
+    # How long a write waits for room when the queue is full, before giving up on the entry
+    _FULL_TIMEOUT = 5
+    def __init__(self, path, fsync="never", capacity=64):
+        if fsync not in FSYNC_POLICIES:
+            raise RuntimeError("Política de fsync {} desconocida, las válidas son {}".format(fsync, ", ".join(FSYNC_POLICIES)))
+
+        self._path = path
+        self._fsync = fsync
+        self._queue = queue.Queue(maxsize=capacity)
+        self._latencies = []
+        self._logger = logging.getLogger(".pomodoro_log")
+
+        # A daemon, a log nobody closed can't keep the process alive. Forked
+        # processes end without joining threads anyway, close() is what waits.
+        self._thread = threading.Thread(target=self._write_loop, name="pomodoro_log", daemon=True)
+        self._thread.start()
+
+    def write(self, entry):
+        item = (time.perf_counter(), entry)
+        try:
+            self._queue.put_nowait(item)
+        except queue.Full:
+            self._logger.warning("The log of pomodoros is falling behind, waiting for room")
+            try:
+                self._queue.put(item, timeout=self._FULL_TIMEOUT)
+            except queue.Full:
+                self._logger.error("The log of pomodoros is stuck, entry not written: %s", entry)
+
+    def close(self, wait=True):
+        """Once every entry is written the writer stops, with wait it is also joined"""
+        self._queue.put(_CLOSE)
+        if wait:
+            self._thread.join()
+
+    def metrics(self):
+        """Entries written and the time from write() until they were on the file, in ms"""
+        latencies = sorted(self._latencies)
+        if not latencies:
+            return {"writes": 0}
+
+        return {
+            "writes": len(latencies),
+            "p50": round(latencies[len(latencies) // 2] * 1e3, 3),
+            "max": round(latencies[-1] * 1e3, 3),
+            "mean": round(statistics.fmean(latencies) * 1e3, 3),
+        }
+
+    def _write_loop(self):
+        try:
+            with open(path_to_file(self._path), "a") as log:
+                while self._write_batch(log):
+                    pass
+
+                if self._fsync == "close":
+                    os.fsync(log.fileno())
+        except OSError:
+            self._logger.exception("Could not write the log of pomodoros %s", self._path)
+            self._drain()
+
+        self._logger.info("Log of pomodoros closed. Write latency: %s",
+                ", ".join("{}={}".format(k, v) for k, v in self.metrics().items()))
+
+    def _write_batch(self, log):
+        """Writes what is queued at once, False when it was told to close"""
+        batch = [self._queue.get()]
+        while True:
+            try:
+                batch.append(self._queue.get_nowait())
+            except queue.Empty:
+                break
+
+        entries = [item for item in batch if item is not _CLOSE]
+        if entries:
+            log.write("".join("\n" + entry for _, entry in entries))
+            log.flush()
+            if self._fsync == "always":
+                os.fsync(log.fileno())
+
+            written_at = time.perf_counter()
+            self._latencies.extend(written_at - queued_at for queued_at, _ in entries)
+
+        return len(entries) == len(batch)
+
+    def _drain(self):
+        """After a failure, the entries still go to the app log until it is closed"""
+        while True:
+            item = self._queue.get()
+            if item is _CLOSE:
+                return
+            self._logger.error("Entry not written: %s", item[1])
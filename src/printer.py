@@ -3,18 +3,33 @@ from pyfiglet import Figlet
 import curses
 from curses import textpad
 import curses.ascii
-from datetime import datetime, timedelta
+from functools import lru_cache
 import logging
-from os import getpid
+import os
 import signal
 import subprocess
+import time
 
 from messages import *
-
-def printer(msg_queue, tags):
-    curses.wrapper(printer_display, msg_queue, tags)
-
-def printer_display(stdscr, msg_queue, tags):
+from runtime import Blocking, Wait
+from stopwatch import stopwatch_time
+
+def printer(msg_queue, tags, resolution=Resolution.Seconds):
+    """Same set up and tear down of the terminal as curses.wrapper, for a loop"""
+    stdscr = curses.initscr()
+    try:
+        curses.noecho()
+        curses.cbreak()
+        stdscr.keypad(1)
+
+        yield from printer_display(stdscr, msg_queue, tags, resolution)
+    finally:
+        stdscr.keypad(0)
+        curses.echo()
+        curses.nocbreak()
+        curses.endwin()
+
+def printer_display(stdscr, msg_queue, tags, resolution=Resolution.Seconds):
     global _msg_queue 
     _msg_queue = msg_queue
 
@@ -27,15 +42,16 @@ def printer_display(stdscr, msg_queue, tags):
     # Obtener tamaño de la pantalla
     height, width = stdscr.getmaxyx()
 
-    (Screen(
+    yield from (Screen(
         TimerLayout(
             curses.newwin(height, width), 
             height, 
-            width),
+            width,
+            resolution),
         build_input_layout(height,width),
         build_tag_input_layout(height,width,tags),
         screen=stdscr
-     )).run()
+     )).loop()
 
 
 def build_input_layout(height, width):
@@ -73,35 +89,50 @@ def tag_input_layout(height, width):
     })
 
 class Screen:
+    """
+    Refreshes the layouts when a message or a resize changes something. Only
+    while a tile animates does it also refresh on its own, every frame.
+    """
+    _FRAME_SECONDS = 0.5
+
     def __init__(self, *layouts, screen):
         self._layouts = layouts
-        self._must_update = datetime.now()
+        self._next_frame = time.monotonic()
         self._must_finish = False
         self._must_draw = True
+        self._must_refresh = True
         self._screen = screen
 
-        self._msgs_pipe = _msg_queue.suscribe(*[event for event in Event],suscriber=getpid())
+        self._suscriber = suscriber_id("printer")
+        self._msgs_pipe = _msg_queue.suscribe(*[event for event in Event],suscriber=self._suscriber, policy=QueuePolicy.Coalesce)
         signal.signal(signal.SIGWINCH, self._resize_event_handler)
+        self._signals_fd = self._wakeup_on_signals()
         self._logger = logging.getLogger(".printer")
 
-    def run(self):
+    def loop(self):
         event_printer_ready(_msg_queue)
 
         while not self._must_finish:
+            ready = yield Wait((self._msgs_pipe,), (self._signals_fd,), self._seconds_to_next_frame())
+            if self._signals_fd in ready:
+                self._drain_signals()
+
             self._pool_for_msgs()
             self._refresh_if_have_to()
+            yield from self._read_inputs()
             
-        _msg_queue.unsuscribe(getpid(), [event for event in Event])
+        _msg_queue.unsuscribe(self._suscriber, [event for event in Event])
 
     def _pool_for_msgs(self):
         while self._msgs_pipe.poll():
             msg = self._msgs_pipe.recv()
 
-            self._logger.debug("Printer is consuming msg {}".format(msg))
+            self._logger.debug("Printer is consuming msg %s", msg)
+            self._must_refresh = True
 
             if msg.kind == Event.StopPrinter:
                 self._must_finish = True
-                _msg_queue.unsuscribe(getpid(), [event for event in Event])
+                _msg_queue.unsuscribe(self._suscriber, [event for event in Event])
                 return
 
             if msg.kind == Event.LayoutDraw:
@@ -111,7 +142,7 @@ class Screen:
                 layout.process(msg)
 
     def _refresh_if_have_to(self):
-        if not self._time_is_up():
+        if not self._must_refresh and not self._frame_is_due():
             return
         
         for layout in self._layouts:
@@ -121,16 +152,43 @@ class Screen:
             layout.refresh()
             
         self._must_draw = False
-        self._set_next_update()
-
-    def _time_is_up(self):
-        return self._must_update < datetime.now()
+        self._must_refresh = False
+        self._next_frame = time.monotonic() + self._FRAME_SECONDS
 
-    def _set_next_update(self):
-        self._must_update = datetime.now() + timedelta(seconds=0.5)
+    def _read_inputs(self):
+        """The user types off the loop, under asyncio the other loops go on meanwhile"""
+        for layout in self._layouts:
+            for tile, read in layout.pending_inputs():
+                tile.input_read((yield Blocking(read)))
+
+    def _animating(self):
+        return any(layout.animating() for layout in self._layouts)
+
+    def _frame_is_due(self):
+        return self._animating() and self._next_frame <= time.monotonic()
+
+    def _seconds_to_next_frame(self):
+        if not self._animating():
+            return None
+        return max(0, self._next_frame - time.monotonic())
+
+    def _wakeup_on_signals(self):
+        """A fd that becomes readable when a signal (like a resize) arrives"""
+        (read_fd, write_fd) = os.pipe()
+        os.set_blocking(read_fd, False)
+        os.set_blocking(write_fd, False)
+        signal.set_wakeup_fd(write_fd)
+        return read_fd
+
+    def _drain_signals(self):
+        try:
+            while os.read(self._signals_fd, 512):
+                pass
+        except BlockingIOError:
+            pass
 
     def _resize_event_handler(self, signum, frame):
-        self._logger.debug("Resize event received signum: {} frame: {}".format(signum, frame))
+        self._logger.debug("Resize event received signum: %s frame: %s", signum, frame)
         height, width = self._native_getmaxyx()
         curses.resize_term(height,width)
         curses.resizeterm(height, width)
@@ -140,6 +198,7 @@ class Screen:
             layout.resize(height, width)
 
         self._must_draw = True
+        self._must_refresh = True
 
     def _native_getmaxyx(self):
         def get_os_cmd_output(cmd_list):
@@ -163,12 +222,18 @@ class Layout:
     def resize(self, height, width):
         self._tiles_do(lambda window: window.resize(height, width))
 
+    def animating(self):
+        return any(tile.animating() for tile in self._tiles)
+
+    def pending_inputs(self):
+        return [(tile, read) for tile in self._tiles if (read := tile.pending_input())]
+
     def _tiles_do(self, func):
         for tile in self._tiles:
             func(tile)
 
 class TimerLayout(Layout):
-    def __init__(self, window, height, width): 
+    def __init__(self, window, height, width, resolution=Resolution.Seconds): 
         self._window = window
         self._height = height
         self._width = width
@@ -191,7 +256,8 @@ class TimerLayout(Layout):
                 layout["timer_y_offset"], 
                 layout["timer_x_offset"]), 
             width=layout["timer_x"],
-            height=layout["timer_y"])
+            height=layout["timer_y"],
+            resolution=resolution)
 
         self._manual = ManualTile(
             window=self._window.derwin(
@@ -211,6 +277,15 @@ class TimerLayout(Layout):
             width=layout["command_input_x"],
             height=layout["command_input_y"])
 
+        self._stopwatch = StopwatchTile(
+            window=self._window.derwin(
+                max(1, layout["stopwatch_y"]), 
+                layout["stopwatch_x"], 
+                layout["stopwatch_y_offset"], 
+                layout["stopwatch_x_offset"]), 
+            width=layout["stopwatch_x"],
+            height=layout["stopwatch_y"])
+
         self._app_messages = AppMessagesTile(
             window=self._window.derwin(
                 layout["app_messages_y"], 
@@ -225,6 +300,7 @@ class TimerLayout(Layout):
             self._timer,
             self._manual,
             self._command_input,
+            self._stopwatch,
             self._app_messages
         ]
         self._logger = logging.getLogger(".timer_layout")
@@ -235,7 +311,7 @@ class TimerLayout(Layout):
 
         self._window.clear()
         self._window.refresh() # Esto no debería ser necesario. Y hasta creo que está mal conceptualmente.
-        self._logger.debug("TimerLayout window resized to y:{} x:{}".format(height, width))
+        self._logger.debug("TimerLayout window resized to y:%s x:%s", height, width)
         self._window.resize(height,width)
 
         layout = self.main_layout()
@@ -252,6 +328,9 @@ class TimerLayout(Layout):
         self._command_input.resize(
             layout["command_input_y"], layout["command_input_x"], 
             layout["command_input_y_offset"], layout["command_input_x_offset"])
+        self._stopwatch.resize(
+            layout["stopwatch_y"], layout["stopwatch_x"], 
+            layout["stopwatch_y_offset"], layout["stopwatch_x_offset"])
         self._app_messages.resize(
             layout["app_messages_y"], layout["app_messages_x"], 
             layout["app_messages_y_offset"], layout["app_messages_x_offset"])
@@ -271,8 +350,12 @@ class TimerLayout(Layout):
         command_input_height = 3
         command_input_width = width - manual_width
 
-        app_messages_height = manual_height - command_input_height
-        app_messages_y_offset = height_offset + command_input_height 
+        # The stopwatch only takes its rows when the app messages keep as many
+        stopwatch_height = StopwatchTile.HEIGHT if manual_height - command_input_height >= 2 * StopwatchTile.HEIGHT else 0
+        stopwatch_y_offset = height_offset + command_input_height
+
+        app_messages_height = manual_height - command_input_height - stopwatch_height
+        app_messages_y_offset = stopwatch_y_offset + stopwatch_height
 
         return dict({
             "status_bar_y" : status_bar_height,
@@ -295,6 +378,11 @@ class TimerLayout(Layout):
             "command_input_y_offset" : height_offset,
             "command_input_x_offset" : manual_width,
 
+            "stopwatch_y" : stopwatch_height,
+            "stopwatch_x" : command_input_width,
+            "stopwatch_y_offset" : stopwatch_y_offset,
+            "stopwatch_x_offset" : manual_width,
+
             "app_messages_y" : app_messages_height,
             "app_messages_x" : command_input_width,
             "app_messages_y_offset" : app_messages_y_offset,
@@ -321,6 +409,17 @@ class Tile(ABC):
     def draw(self) -> None:
         raise RuntimeError("Shouldn't be used")
 
+    def pending_input(self):
+        """The blocking read of the input the tile asks for, None when it asks for none"""
+        return None
+
+    def input_read(self, value) -> None:
+        pass
+
+    def animating(self) -> bool:
+        """Whether the tile changes by itself, without any message"""
+        return False
+
     def resize(self, height, width, height_offset=0, width_offset=0):
         self.height = height
         self.width = width
@@ -328,15 +427,15 @@ class Tile(ABC):
         self.window.clear()
 
         if height_offset != 0 or width_offset != 0:
-            self._logger.debug("Tile {} window moved to y:{} x:{}".format(type(self).__name__, height_offset, width_offset))
+            self._logger.debug("Tile %s window moved to y:%s x:%s", type(self).__name__, height_offset, width_offset)
             self.window.mvderwin(height_offset, width_offset)
             self.window.clear()
 
-        self._logger.debug("Tile {} window resized to y:{} x:{}".format(type(self).__name__, height, width))
+        self._logger.debug("Tile %s window resized to y:%s x:%s", type(self).__name__, height, width)
         self.window.resize(height, width)
 
     def _refresh(self) -> None:
-        self._logger.debug("Tile {} window refreshed having dims y:{} x:{}".format(type(self).__name__, self.height, self.width))
+        self._logger.debug("Tile %s window refreshed having dims y:%s x:%s", type(self).__name__, self.height, self.width)
         self.window.refresh()
 
     def addstr(self, pos_y, pos_x, text, color=None):
@@ -351,14 +450,17 @@ class Tile(ABC):
             self.window.addstr(pos_y, pos_x, text[:limit])
 
 class TimerTile(Tile):
-    def __init__(self, window, width, height):
+    def __init__(self, window, width, height, resolution=Resolution.Seconds):
         super().__init__(window, width, height)
 
+        self._resolution = resolution
         self._text_effect = NoneTextEffect()
         self._figlet = Figlet(font="standard")
+        self._figlet_lines = lru_cache(maxsize=256)(self._render_figlet)
         self._logger = logging.getLogger(".timer_window")
 
         self._time = ""
+        self._focused = ""
         self._color = None
         self._on_break = False
         self._start_y = 1
@@ -383,27 +485,25 @@ class TimerTile(Tile):
     def process(self, msg):
         match msg.kind:
             case Event.TimeChange:
-                self._time = msg.msg
+                # Traces recorded before the paused flag don't carry it
+                units, phase, focused, *paused = msg.msg
+                self._time = _spaced_time(units, self._resolution)
                 self._ticks += 1
-
-            case Event.TimerStopped:
-                self._text_effect = BlinkTextEffect()
+                self._set_focused(focused)
+                self._set_on_break(Phase(phase) == Phase.Break)
+                self._set_paused(any(paused))
 
             case Event.AudioPlayback:
                 self._text_effect = SlideTextEffect()
 
-            case Event.AudioStopped | Event.TimerResumed | Event.PomodoroBegin:
+            case Event.AudioStopped | Event.PomodoroBegin:
                 self._text_effect = NoneTextEffect()
 
             case Event.BreakBegin:
-                self._start_color()
-                self._on_break = True
-                self.draw()
+                self._set_on_break(True)
 
-            case Event.BreakFinished:
-                self._shutdown_color()
-                self._on_break = False
-                self.draw()
+            case Event.BreakFinished | Event.SessionBegin:
+                self._set_on_break(False)
 
             case _:
                 pass
@@ -412,13 +512,15 @@ class TimerTile(Tile):
         if self._text_effect.empty():
             self._text_effect.refill()
 
-        self._text_effect.render(self, self._spaced_str(self._time))
+        self._text_effect.render(self, self._time)
 
         self._refresh()
 
+    def animating(self):
+        return self._text_effect.animated()
+
     def render(self, text):
-        figlet_str = self._figlet.renderText(text)
-        splited_str = figlet_str.splitlines()
+        splited_str = self._figlet_lines(text)
         self._update_once_when_str_fullsize(splited_str)
         for index, line in enumerate(splited_str):
             self.addstr( self._start_y + index, 1, " " * (self.width - 2))  # Limpiar la línea
@@ -446,13 +548,46 @@ class TimerTile(Tile):
         self._start_y = self.height // 2 - str_height // 2
         self._start_x = self.width // 2 - one_line_width // 2
 
+    def _render_figlet(self, text):
+        """The ticks repeat the same few texts, so the lines are cached by text"""
+        return tuple(self._figlet.renderText(text).splitlines())
+
+    def _set_on_break(self, on_break):
+        if on_break == self._on_break:
+            return
+
+        if on_break:
+            self._start_color()
+        else:
+            self._shutdown_color()
+        self._on_break = on_break
+        self.draw()
+
+    def _set_paused(self, paused):
+        """Blinks while the countdown shown is paused"""
+        blinking = isinstance(self._text_effect, BlinkTextEffect)
+        if paused and not blinking:
+            self._text_effect = BlinkTextEffect()
+        elif not paused and blinking:
+            self._text_effect = NoneTextEffect()
+
+    def _set_focused(self, focused):
+        if focused == self._focused:
+            return
+
+        self._focused = focused
+        self.draw()
+
     def _draw_on_break(self):
         self.window.box()
         self.addstr(0, 2, " En descanso ")
 
     def _draw_default_layout(self):
         self.window.box()
-        self.addstr(0, 2, " Tiempo para finalizar ")
+        if self._focused:
+            self.addstr(0, 2, " Recordatorio {} ".format(self._focused))
+        else:
+            self.addstr(0, 2, " Tiempo para finalizar ")
 
     def _start_color(self):
         self._color = curses.color_pair(1) # green color
@@ -460,9 +595,16 @@ class TimerTile(Tile):
     def _shutdown_color(self):
         self._color = None
 
-    def _spaced_str(self, time_str):
-        numbers_splited = time_str.split(":")
-        return " : ".join(numbers_splited)
+def _spaced_time(units, resolution=Resolution.Seconds):
+    match resolution:
+        case Resolution.Hours:
+            return "{:02d} h".format(units)
+        case Resolution.Minutes:
+            return "{:02d} : {:02d}".format(units // 60, units % 60)
+        case Resolution.Tenths:
+            return "{} . {}".format(_spaced_time(units // 10), units % 10)
+        case _:
+            return "{:02d} : {:02d} : {:02d}".format(units // 3600, (units // 60) % 60, units % 60)
 
 class AppMessagesTile(Tile):
     def __init__(self, window, width, height):
@@ -510,6 +652,76 @@ class CommandInputTile(Tile):
 
         self._refresh()
 
+class StopwatchTile(Tile):
+    """
+    Counts the stopwatch of Main by itself from the moment it hears it started,
+    so it animates while running without a msg per second. Each lap brings the
+    exact split and puts the count back on it. On a terminal too short for it,
+    it is hidden.
+    """
+    HEIGHT = 3
+
+    def __init__(self, window, width, height):
+        super().__init__(window, width, height)
+
+        self._hidden = height < self.HEIGHT
+
+        self._origin = None
+        self._elapsed = 0
+        self._laps = 0
+        self._last_lap = 0
+
+    def resize(self, height, width, height_offset, width_offset):
+        self._hidden = height < self.HEIGHT
+        super().resize(max(1, height), width, height_offset, width_offset)
+
+    def draw(self):
+        if self._hidden:
+            return
+
+        self.window.clear()
+        self.window.box()
+        self.addstr(0, 2, " Stopwatch ")
+
+    def process(self, msg):
+        match msg.kind:
+            case Event.StopwatchStarted:
+                self._origin = time.monotonic()
+                self._laps = 0
+
+            case Event.StopwatchLap:
+                self._laps, split_ms, lap_ms = msg.msg
+                self._origin = time.monotonic() - split_ms / 1000
+                self._last_lap = lap_ms / 1000
+
+            case Event.StopwatchStopped:
+                elapsed_ms, self._laps = msg.msg
+                self._origin = None
+                self._elapsed = elapsed_ms / 1000
+
+            case _:
+                pass
+
+    def refresh(self):
+        if self._hidden:
+            return
+
+        if self._origin is not None:
+            text = stopwatch_time(time.monotonic() - self._origin, tenths=False)
+        else:
+            text = stopwatch_time(self._elapsed)
+
+        if self._laps:
+            text += "   vuelta {}: {}".format(self._laps, stopwatch_time(self._last_lap))
+
+        self.addstr(1, 1, " " * (self.width - 2))  # Limpiar la línea
+        self.addstr(1, 1, text)
+
+        self._refresh()
+
+    def animating(self):
+        return self._origin is not None and not self._hidden
+
 class ManualTile(Tile):
     def __init__(self, window, width, height):
         super().__init__(window=window, width=width, height=height)
@@ -543,8 +755,10 @@ class ManualTile(Tile):
         p   Pausar/continuar con el temporizador
         f   Finalizar el temporizador ó Detener el sonido de finalización del timer.
         t   Iniciar/detener un stopwatch
+        l   Marcar una vuelta del stopwatch
         i   Agregar una intención/propósito para la sesión en curso
         r   Cambiar el tag actual
+        n   Mostrar la siguiente cuenta atrás, si hay recordatorios
         """
         return manual
 
@@ -553,8 +767,10 @@ class ManualTile(Tile):
         Las opciones de teclas son:
         f   Finalizar el temporizador ó Detener el sonido de finalización del timer.
         t   Iniciar/detener un stopwatch
+        l   Marcar una vuelta del stopwatch
         i   Agregar una intención/propósito para la sesión en curso
         r   Cambiar el tag actual
+        n   Mostrar la siguiente cuenta atrás, si hay recordatorios
         """
         return manual
 
@@ -601,6 +817,15 @@ class StatusBarTile(Tile):
             case Event.PomodoroFinished:
                 self._pomodoros_done += 1
 
+            case Event.SessionBegin:
+                self._tag = ""
+                self._purpose = ""
+                self._pomodoros_done = 0
+                self._pomodoros_to_complete = "?"
+                self._end_time_dirty = True
+                self.window.clear()
+                self.draw()
+
     def refresh(self):
         pos_y = 1
         pos_x = 2
@@ -676,24 +901,30 @@ class PurposeInputTile(Tile):
             self._show = True
 
     def refresh(self):
-        if self._show:
-            textbox_win = self.window.derwin(self.height-4, self.width-3, 2, 2)
-            textbox = textpad.Textbox(textbox_win)
-            self.draw()
-            self.window.refresh()
+        pass
 
-            def validator(ascii_key):
-                ascii_enter = 10
-                if ascii_key == ascii_enter: 
-                    return curses.ascii.BEL
-                return ascii_key
-            purpose = textbox.edit( validator ).strip()
+    def pending_input(self):
+        return self._edit_purpose if self._show else None
 
-            textbox_win = None
-            self._show = False
-            event_purpose_added(_msg_queue, purpose)
-            event_purpose_finished(_msg_queue)
-            event_layout_draw(_msg_queue)
+    def input_read(self, purpose):
+        self._show = False
+        with EventBatch(_msg_queue) as batch:
+            event_purpose_added(batch, purpose)
+            event_purpose_finished(batch)
+            event_layout_draw(batch)
+
+    def _edit_purpose(self):
+        textbox_win = self.window.derwin(self.height-4, self.width-3, 2, 2)
+        textbox = textpad.Textbox(textbox_win)
+        self.draw()
+        self.window.refresh()
+
+        def validator(ascii_key):
+            ascii_enter = 10
+            if ascii_key == ascii_enter: 
+                return curses.ascii.BEL
+            return ascii_key
+        return textbox.edit( validator ).strip()
 
     def draw(self):
         self.window.clear()
@@ -716,14 +947,18 @@ class TagInputTile(Tile):
             self._show = True
 
     def refresh(self):
-        if self._show:
-            selected = self._show_list_menu()
+        pass
 
-            self._show = False
-            tag = self._tags[selected] if self._tags[selected] != self._no_tag else None
-            event_tag_changed(_msg_queue, tag)
-            event_tag_finished(_msg_queue)
-            event_layout_draw(_msg_queue)
+    def pending_input(self):
+        return self._show_list_menu if self._show else None
+
+    def input_read(self, selected):
+        self._show = False
+        tag = self._tags[selected] if self._tags[selected] != self._no_tag else None
+        with EventBatch(_msg_queue) as batch:
+            event_tag_changed(batch, tag)
+            event_tag_finished(batch)
+            event_layout_draw(batch)
 
     def draw(self):
         self.window.clear()
@@ -778,6 +1013,10 @@ class TextEffect(ABC):
     def render(self, window, text) -> None:
         pass
 
+    def animated(self) -> bool:
+        """Whether each frame looks different, even with the same text"""
+        return True
+
 class NoneTextEffect(TextEffect):
     def __init__(self):
         self._logger = logging.getLogger(".none_text_effect")
@@ -788,6 +1027,9 @@ class NoneTextEffect(TextEffect):
     def refill(self):
         pass
 
+    def animated(self):
+        return False
+
     def render(self, window, text):
         window.render(text)
 
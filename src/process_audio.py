@@ -1,69 +1,65 @@
-import pydub, simpleaudio, wave
-import time
-import os
-from datetime import datetime, timedelta
+import pydub, simpleaudio
+from functools import lru_cache, partial
+import logging
 
-from utils import path_to_file, file_path_in_home
-from global_data import TEMPORARY_PATH
+from clock import SYSTEM_CLOCK
+from utils import path_to_file
 from messages import *
+from runtime import Wait, Blocking
 
-def audio_process(args, audio_path, msg_queue):
+def audio_process(args, audio_path, msg_queue, clock=SYSTEM_CLOCK):
     """audio - play audio on background"""
 
-    mp3_path = path_to_file(audio_path)
-    audio = pydub.AudioSegment.from_mp3(mp3_path)
-    NEW_AUDIO_PATH = file_path_in_home(TEMPORARY_PATH, "timer_audio.wav")
-    pipe = msg_queue.suscribe(Event.AudioTerminate, suscriber=os.getpid())
+    wave_object, length = yield Blocking(partial(decoded_audio, audio_path))
+    suscriber = suscriber_id("audio")
+    pipe = msg_queue.suscribe(Event.AudioTerminate, suscriber=suscriber)
 
     try:
-        audio.export(NEW_AUDIO_PATH, format="wav")
-        wave_object = simpleaudio.WaveObject.from_wave_file(NEW_AUDIO_PATH)
         play_object = wave_object.play()
 
-        continue_play = when_to_stop(NEW_AUDIO_PATH)
+        end_of_song = when_to_stop(length, clock)
         # and play_object.is_playing()
-        while continue_play() :
-            if pipe.poll():
+        while clock.monotonic() < end_of_song:
+            if (yield Wait((pipe,), timeout=end_of_song - clock.monotonic())):
                 msg = pipe.recv()
 
                 if msg.kind == Event.AudioTerminate:
                     play_object.stop()
                     break
 
-            else:
-                time.sleep(0.5)
-
         event_audio_ended(msg_queue)
 
     finally:
-        if os.path.exists(NEW_AUDIO_PATH):
-            os.remove(NEW_AUDIO_PATH)
+        msg_queue.unsuscribe(suscriber, [Event.AudioTerminate])
 
-        msg_queue.unsuscribe(os.getpid(), [Event.AudioTerminate])
+@lru_cache(maxsize=8)
+def decoded_audio(audio_path):
+    """
+    The audio ready to be played and its length in seconds. Decoded once per
+    process, the processes started afterwards inherit it already decoded.
+    """
+    audio = pydub.AudioSegment.from_mp3(path_to_file(audio_path))
+    wave_object = simpleaudio.WaveObject(audio.raw_data, audio.channels, audio.sample_width, audio.frame_rate)
+    return wave_object, int(audio.duration_seconds)
 
-def when_to_stop(wav_file):
-    length = length_in_seconds(wav_file)
-    end_of_song = datetime.now() + timedelta(seconds=(length-1))
-    return lambda: datetime.now() < end_of_song
+def preload_audio(*audio_paths):
+    for audio_path in audio_paths:
+        try:
+            decoded_audio(audio_path)
+        except Exception:
+            # Playing it will fail on its own process, like without preloading
+            logging.getLogger(".audio").warning("Could not decode audio %s", audio_path, exc_info=True)
 
-def length_in_seconds(file):
-    length = None
-    with wave.open(file, 'rb') as wav:
-        length = wav.getnframes() / float(wav.getframerate())
-    return int(length)
+def when_to_stop(length, clock=SYSTEM_CLOCK):
+    """Monotonic time of the clock at which the song of that length is considered finished"""
+    return clock.monotonic() + (length-1)
 
 def audio_process_short(args, audio_path, msg_queue):
-    mp3_path = path_to_file(audio_path)
-    audio = pydub.AudioSegment.from_mp3(mp3_path)
-    NEW_AUDIO_PATH = file_path_in_home(TEMPORARY_PATH, "pomo_audio.wav")
+    wave_object, length = yield Blocking(partial(decoded_audio, audio_path))
 
     try:
-        audio.export(NEW_AUDIO_PATH, format="wav")
-        wave_object = simpleaudio.WaveObject.from_wave_file(NEW_AUDIO_PATH)
-        play_object = wave_object.play()
-        time.sleep(length_in_seconds(NEW_AUDIO_PATH))
+        wave_object.play()
+        yield Wait(timeout=length)
 
     finally:
         event_audio_stopped(msg_queue)
-        if os.path.exists(NEW_AUDIO_PATH):
-            os.remove(NEW_AUDIO_PATH)
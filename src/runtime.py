@@ -0,0 +1,155 @@
+"""
+The loops of the app (Main, Screen, Countdown, audio) are written
+as generators that yield what they need to wait for. A runtime drives them:
+ProcessRuntime runs each one on its own process blocking on wait(), while
+AsyncRuntime runs them as asyncio tasks sharing a single process.
+"""
+
+import asyncio
+from dataclasses import dataclass
+import multiprocessing
+import select
+import time
+
+from messages import wait
+
+@dataclass(frozen=True)
+class Wait:
+    """Resumes the loop with the ready pipes and fds, see messages.wait"""
+    pipes : tuple = ()
+    fds : tuple = ()
+    timeout : float | None = None
+
+@dataclass(frozen=True)
+class Blocking:
+    """Work that would stall an event loop, like decoding audio. Resumes the loop with its result"""
+    func : object
+
+@dataclass(frozen=True)
+class Join:
+    """Resumes the loop once the started loop behind the handle finished"""
+    handle : object
+
+def run_loop(loop):
+    try:
+        result = None
+        while True:
+            try:
+                request = loop.send(result)
+            except StopIteration:
+                return
+
+            match request:
+                case Wait():
+                    result = wait(request.pipes, request.fds, request.timeout)
+                case Blocking():
+                    result = request.func()
+                case Join():
+                    result = request.handle.join()
+    finally:
+        loop.close()
+
+async def run_loop_async(loop):
+    try:
+        result = None
+        while True:
+            try:
+                request = loop.send(result)
+            except StopIteration:
+                return
+
+            match request:
+                case Wait():
+                    result = await wait_async(request.pipes, request.fds, request.timeout)
+                case Blocking():
+                    result = await asyncio.get_running_loop().run_in_executor(None, request.func)
+                case Join():
+                    result = await request.handle.wait()
+    finally:
+        loop.close()
+
+def run_loop_virtual(loop, clock):
+    """
+    Runs the loop on the time of a clock.VirtualClock: a wait with nothing to
+    read moves the clock to its timeout right away instead of sleeping.
+    """
+    try:
+        result = None
+        while True:
+            try:
+                request = loop.send(result)
+            except StopIteration:
+                return
+
+            match request:
+                case Wait():
+                    # Same as wait(..., 0) without setting up a selector on every tick
+                    result = [pipe for pipe in request.pipes if pipe.poll()] + select.select(request.fds, [], [], 0)[0]
+                    if not result:
+                        if request.timeout is None:
+                            raise RuntimeError("El bucle espera mensajes que nunca van a llegar")
+                        clock.advance(request.timeout)
+                case Blocking():
+                    result = request.func()
+                case Join():
+                    raise RuntimeError("Un bucle con tiempo virtual no puede esperar a otros")
+    finally:
+        loop.close()
+
+async def wait_async(pipes=(), fds=(), timeout=None):
+    """Same as messages.wait but awaiting on the event loop instead of blocking it"""
+    ready = wait(pipes, fds, 0)
+    if ready or timeout == 0:
+        return ready
+
+    loop = asyncio.get_running_loop()
+    woken = asyncio.Event()
+    deadline = None if timeout is None else time.monotonic() + timeout
+
+    for fileobj in [*pipes, *fds]:
+        loop.add_reader(fileobj, woken.set)
+
+    try:
+        while True:
+            remaining = None if deadline is None else max(0, deadline - time.monotonic())
+
+            try:
+                await asyncio.wait_for(woken.wait(), remaining)
+            except asyncio.TimeoutError:
+                pass
+
+            ready = wait(pipes, fds, 0)
+            if ready or (deadline is not None and deadline <= time.monotonic()):
+                return ready
+            woken.clear()
+    finally:
+        for fileobj in [*pipes, *fds]:
+            loop.remove_reader(fileobj)
+
+class ProcessRuntime:
+    """Each loop runs on its own process"""
+    def start(self, target, *args):
+        process = multiprocessing.Process(target=_run_process, args=(target, args))
+        process.start()
+        return process
+
+def _run_process(target, args):
+    run_loop(target(*args))
+
+class AsyncRuntime:
+    """Every loop runs as a task on the running event loop of this process"""
+    def start(self, target, *args):
+        return TaskHandle(asyncio.get_running_loop().create_task(run_loop_async(target(*args))))
+
+class TaskHandle:
+    def __init__(self, task):
+        self._task = task
+
+    async def wait(self):
+        await asyncio.wait([self._task])
+
+    def terminate(self):
+        self._task.cancel()
+
+    def is_alive(self):
+        return not self._task.done()
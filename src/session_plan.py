@@ -0,0 +1,85 @@
+"""
+Timeline of a whole session, laid out once when it is created.
+
+Every moment is a second of the session counted from its beginning, pauses
+excluded. Pomodoros and breaks repeat with a fixed cycle, so the phase, its
+end, the next boundary and the pomodoros done at any second come from
+arithmetic on that cycle instead of walking the session. Pausing and resuming
+only move where the session second 0 falls on the monotonic clock.
+"""
+
+from messages import Phase
+
+class SessionPlan:
+    def __init__(self, seconds, pomodoro_seconds=0, break_seconds=None):
+        """
+        A session of seconds. With pomodoro_seconds it is split in pomodoros,
+        with break_seconds as well there is a break after each one but the last.
+        """
+        self.seconds = seconds
+        self._pomodoro = pomodoro_seconds
+        self._break = break_seconds
+        self._cycle = pomodoro_seconds + (break_seconds or 0)
+        self.pomodoros = self.pomodoros_done(seconds)
+
+        # Where the session second 0 is on the monotonic clock, None while stopped
+        self._origin = None
+        self._elapsed = 0
+
+    def start(self, now):
+        self._origin = now - self._elapsed
+
+    def pause(self, now):
+        self._elapsed = self.elapsed(now)
+        self._origin = None
+
+    def resume(self, now):
+        self.start(now)
+
+    def skip_to(self, elapsed):
+        """Before starting, to go on with a session from its middle"""
+        self._elapsed = elapsed
+
+    def elapsed(self, now):
+        if self._origin is None:
+            return self._elapsed
+        return now - self._origin
+
+    def at(self, second):
+        """When that second of the session is due on the monotonic clock, only while running"""
+        return self._origin + second
+
+    def time_to_end(self, now):
+        return self.seconds - self.elapsed(now)
+
+    def next_boundary(self, second):
+        """The first second after this one where a phase ends or a pomodoro is done"""
+        if not self._pomodoro:
+            return self.seconds
+
+        cycle, offset = divmod(second, self._cycle)
+        boundary = cycle * self._cycle + (self._pomodoro if offset < self._pomodoro else self._cycle)
+        return min(self.seconds, boundary)
+
+    def phase(self, second):
+        if self._break is None:
+            return Phase.Timer
+        if self.seconds <= second or second % self._cycle < self._pomodoro:
+            return Phase.Pomodoro
+        return Phase.Break
+
+    def phase_end(self, second):
+        """End of the phase going on at that second"""
+        if self._break is None:
+            return self.seconds
+        return self.next_boundary(second)
+
+    def phase_start(self, pomodoros_done, on_break):
+        """Beginning of the break after the last pomodoro done or of the pomodoro after it"""
+        start = pomodoros_done * self._cycle
+        return start - self._break if on_break else start
+
+    def pomodoros_done(self, second):
+        if not self._pomodoro:
+            return 0
+        return int((second + (self._break or 0)) // self._cycle)
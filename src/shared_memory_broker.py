@@ -0,0 +1,334 @@
+from collections import deque
+import logging
+from multiprocessing import Lock
+from multiprocessing.shared_memory import SharedMemory
+import os
+from os import getpid
+import select
+import struct
+import time
+
+from messages import Event, EventMsg, BusMetrics, RetainedState, encode, decode, peek_kind, process_alive
+from event_trace import TraceWriter
+
+class SharedMemoryEventBroker:
+    """
+    Event bus backed by a ring buffer living in shared memory. A publish is a
+    single copy of the msg into the next slot of the ring; every suscriber
+    keeps its own cursor and filters the events it cares about on its side.
+
+    Publishers are serialized by a lock so the ring behaves as single producer,
+    multiple consumers. The broker must be built before forking the processes
+    that use it.
+
+    A msg longer than a slot is split over as many consecutive slots as it
+    needs. Readers only see it once all of them are written.
+
+    Every reader waits on a pipe of its own, taken from a pool opened before
+    forking. A publish writes a byte on the pipes of the readers in use, so
+    the loops block on their selectors until there is something new.
+
+    New readers start at the head of the ring and get the state of the session
+    as a snapshot first, like with EventBroker. Each process keeps a
+    RetainedState that catches up with the ring under the write lock, and it is
+    stored next to the ring well before the writer laps what it was built from.
+    """
+
+    _HEADER = struct.Struct("<Q") # next sequence number to be written
+    _SLOT_HEADER = struct.Struct("<QIB") # committed sequence + 1, chunk length, flags
+    _MORE = 1 # the msg goes on in the next slot
+    _CONTINUATION = 2 # the slot goes on with the msg of the previous one
+    _CLAIM = struct.Struct("<i") # pid of the process reading from a wake-up pipe, 0 when free
+    _RETAINED_HEADER = struct.Struct("<QI") # sequence the stored state was retained up to, its length
+
+    def __init__(self, slots=1024, slot_size=512, readers=64, retained_size=65536):
+        self._logger = logging.getLogger(".shm_event_broker")
+
+        self._slots = slots
+        self._slot_size = slot_size
+        self._wakeups = [self._wakeup_pipe() for _ in range(readers)]
+        self._retained_offset = self._HEADER.size + readers * self._CLAIM.size
+        self._retained_size = retained_size
+        self._slots_offset = self._retained_offset + self._RETAINED_HEADER.size + retained_size
+        self._shm = SharedMemory(create=True, size=self._slots_offset + slots * slot_size)
+        self._write_lock = Lock()
+        self._readers = {}
+        self._owner = getpid()
+        self._metrics = BusMetrics()
+        self._trace = None
+        self._retained = RetainedState()
+        self._retained_cursor = 0
+
+        self._HEADER.pack_into(self._shm.buf, 0, 0)
+        self._RETAINED_HEADER.pack_into(self._shm.buf, self._retained_offset, 0, 0)
+
+    def suscribe(self, *events, suscriber, policy=None, capacity=None):
+        """The ring never waits on its readers, so the queue policy has no effect here"""
+        for event in events:
+            if not isinstance(event, Event):
+                raise RuntimeError("Event {} is not a valid event".format(event))
+            self._logger.debug("Process %s suscribed to event %s", getpid(), event)
+
+        wakeup = self._claim_wakeup()
+        with self._write_lock:
+            begin = time.perf_counter()
+            self._catch_up()
+            snapshot = self._retained.snapshot(events)
+            (head,) = self._HEADER.unpack_from(self._shm.buf, 0)
+
+        reader = RingReader(self, events, head, wakeup, snapshot)
+        if snapshot:
+            self._metrics.published(EventMsg(Event.Snapshot, snapshot), time.perf_counter() - begin)
+        self._readers.setdefault(suscriber, []).append(reader)
+        return reader
+
+    def publish(self, msg):
+        self.publish_many((msg,))
+
+    def publish_many(self, msgs):
+        begin = time.perf_counter()
+        payloads = [self._payload(msg) for msg in msgs]
+
+        with self._write_lock:
+            for payload in payloads:
+                self._write(payload)
+                if self._trace:
+                    self._trace.write(payload)
+                self._store_retained_if_behind()
+        self._wake_readers()
+
+        latency = (time.perf_counter() - begin) / len(payloads) if payloads else 0
+        for msg, payload in zip(msgs, payloads):
+            self._metrics.published(msg, latency)
+            self._metrics.delivered("ring", payload)
+
+    def unsuscribe(self, suscriber_id, event_list=None):
+        for reader in self._readers.get(suscriber_id, []):
+            reader.discard(Event if event_list is None else event_list)
+            self._logger.debug("deleted consumer %s from events %s", suscriber_id, event_list)
+            if not reader.active():
+                self._release_wakeup(reader.wakeup)
+
+        self._readers[suscriber_id] = [reader for reader in self._readers.get(suscriber_id, []) if reader.active()]
+
+    def record(self, path):
+        """Like EventBroker.record. Must be called before forking, the processes share the file"""
+        self._trace = TraceWriter(path)
+
+    def metrics(self):
+        """
+        Each process keeps its own counters, so these only cover the msgs
+        published from the calling process. Pending is counted in msgs left
+        on the ring for the readers of this process.
+        """
+        (head,) = self._HEADER.unpack_from(self._shm.buf, 0)
+        pending = {suscriber: sum(head - reader.cursor() for reader in readers)
+                   for suscriber, readers in self._readers.items() if readers}
+        return self._metrics.report(pending)
+
+    def shutdown(self):
+        for read_fd, write_fd in self._wakeups:
+            os.close(read_fd)
+            os.close(write_fd)
+        self._shm.close()
+        if getpid() == self._owner:
+            self._shm.unlink()
+
+    def _payload(self, msg):
+        payload = encode(msg)
+        if self._slots < len(self._chunks(payload)):
+            raise RuntimeError("Msg {} doesn't fit in a ring of {} slots of {} bytes".format(msg, self._slots, self._slot_size))
+        return payload
+
+    def _chunks(self, payload):
+        capacity = self._slot_size - self._SLOT_HEADER.size
+        return [payload[start:start + capacity] for start in range(0, len(payload), capacity)]
+
+    def _write(self, payload):
+        buf = self._shm.buf
+        (sequence,) = self._HEADER.unpack_from(buf, 0)
+        chunks = self._chunks(payload)
+
+        for index, chunk in enumerate(chunks):
+            flags = (self._CONTINUATION if index else 0) | (self._MORE if index < len(chunks) - 1 else 0)
+            offset = self._slot_offset(sequence + index)
+            body = offset + self._SLOT_HEADER.size
+
+            self._SLOT_HEADER.pack_into(buf, offset, 0, 0, 0) # invalidate the slot while it's written
+            buf[body:body + len(chunk)] = chunk
+            self._SLOT_HEADER.pack_into(buf, offset, sequence + index + 1, len(chunk), flags)
+
+        self._HEADER.pack_into(buf, 0, sequence + len(chunks))
+
+    def _read(self, cursor):
+        """
+        Returns the cursor after reading and the payload of the msg, None if
+        there is nothing new. When the writer lapped the reader the cursor
+        jumps to the oldest msg still in the ring.
+        """
+        buf = self._shm.buf
+        chunks = []
+        while True:
+            (head,) = self._HEADER.unpack_from(buf, 0)
+            if head <= cursor:
+                return cursor, None
+
+            oldest = self._oldest_sequence(head)
+            if cursor < oldest:
+                self._logger.warning("Reader lapped by the writer, %s slots lost", oldest - cursor)
+                cursor = oldest
+                chunks = []
+
+            offset = self._slot_offset(cursor)
+            body = offset + self._SLOT_HEADER.size
+            committed, length, flags = self._SLOT_HEADER.unpack_from(buf, offset)
+            chunk = bytes(buf[body:body + length])
+            cursor += 1
+
+            if committed != cursor or self._SLOT_HEADER.unpack_from(buf, offset)[0] != committed:
+                # Overwritten while being read, the msg it was part of is lost
+                chunks = []
+                continue
+
+            if flags & self._CONTINUATION and not chunks:
+                # The beginning of this msg was already overwritten
+                continue
+
+            chunks.append(chunk)
+            if not flags & self._MORE:
+                return cursor, b"".join(chunks)
+
+    def _catch_up(self):
+        """Retains what was published since, from the stored state if it is ahead of this process"""
+        buf = self._shm.buf
+        stored, length = self._RETAINED_HEADER.unpack_from(buf, self._retained_offset)
+        if self._retained_cursor < stored:
+            body = self._retained_offset + self._RETAINED_HEADER.size
+            self._retained = RetainedState()
+            for msg in decode(bytes(buf[body:body + length])).msg:
+                self._retained.retain(msg)
+            self._retained_cursor = stored
+
+        while True:
+            self._retained_cursor, payload = self._read(self._retained_cursor)
+            if payload is None:
+                return
+            self._retained.retain(decode(payload))
+
+    def _store_retained_if_behind(self):
+        """Half a ring behind the head, so the state is never built from slots already overwritten"""
+        (head,) = self._HEADER.unpack_from(self._shm.buf, 0)
+        stored, _ = self._RETAINED_HEADER.unpack_from(self._shm.buf, self._retained_offset)
+        if head - stored < self._slots // 2:
+            return
+
+        self._catch_up()
+        data = encode(EventMsg(Event.Snapshot, self._retained.snapshot(set(Event))))
+        if self._retained_size < len(data):
+            raise RuntimeError("The retained state takes {} bytes, more than the {} it has on the ring".format(len(data), self._retained_size))
+
+        body = self._retained_offset + self._RETAINED_HEADER.size
+        self._shm.buf[body:body + len(data)] = data
+        self._RETAINED_HEADER.pack_into(self._shm.buf, self._retained_offset, self._retained_cursor, len(data))
+
+    def _oldest_sequence(self, head=None):
+        if head is None:
+            (head,) = self._HEADER.unpack_from(self._shm.buf, 0)
+        return max(0, head - self._slots)
+
+    def _slot_offset(self, sequence):
+        return self._slots_offset + (sequence % self._slots) * self._slot_size
+
+    def _wakeup_pipe(self):
+        read_fd, write_fd = os.pipe()
+        os.set_blocking(read_fd, False)
+        os.set_blocking(write_fd, False)
+        return read_fd, write_fd
+
+    def _claim_offset(self, index):
+        return self._HEADER.size + index * self._CLAIM.size
+
+    def _claim_wakeup(self):
+        """A wake-up pipe that is free or was left by a process that is gone"""
+        with self._write_lock:
+            for index in range(len(self._wakeups)):
+                (pid,) = self._CLAIM.unpack_from(self._shm.buf, self._claim_offset(index))
+                if pid == 0 or not process_alive(pid):
+                    self._CLAIM.pack_into(self._shm.buf, self._claim_offset(index), getpid())
+                    self._drain_wakeup(index)
+                    return index
+
+        raise RuntimeError("No wake-up pipe left for a new reader, the ring has {}".format(len(self._wakeups)))
+
+    def _release_wakeup(self, index):
+        with self._write_lock:
+            self._CLAIM.pack_into(self._shm.buf, self._claim_offset(index), 0)
+
+    def _wake_readers(self):
+        claims = bytes(self._shm.buf[self._HEADER.size:self._retained_offset])
+        for index, (pid,) in enumerate(self._CLAIM.iter_unpack(claims)):
+            if pid:
+                try:
+                    os.write(self._wakeups[index][1], b"\0")
+                except BlockingIOError:
+                    pass # already full of wake-ups
+
+    def _drain_wakeup(self, index):
+        try:
+            while os.read(self._wakeups[index][0], 512):
+                pass
+        except BlockingIOError:
+            pass
+
+class RingReader:
+    """
+    Consumer end of the ring. Mimics the poll/recv/fileno interface of a Pipe,
+    its fileno is the wake-up pipe. The msgs of the snapshot come first.
+    """
+
+    def __init__(self, broker, events, cursor, wakeup, snapshot=()):
+        self._broker = broker
+        self._events = set(events)
+        self._cursor = cursor
+        self._pending = deque(snapshot)
+        self.wakeup = wakeup
+
+    def poll(self, timeout=0.0):
+        deadline = None if timeout is None else time.monotonic() + timeout
+        while True:
+            # Drained before reading, a publish in between leaves the pipe readable
+            self._broker._drain_wakeup(self.wakeup)
+            if self._fill():
+                return True
+
+            remaining = None if deadline is None else deadline - time.monotonic()
+            if remaining is not None and remaining <= 0:
+                return False
+            select.select([self.fileno()], [], [], remaining)
+
+    def fileno(self):
+        return self._broker._wakeups[self.wakeup][0]
+
+    def recv(self):
+        self.poll(None)
+        return self._pending.popleft()
+
+    def discard(self, events):
+        self._events.difference_update(events)
+
+    def active(self):
+        return len(self._events) != 0
+
+    def cursor(self):
+        return self._cursor
+
+    def _fill(self):
+        while not self._pending:
+            self._cursor, payload = self._broker._read(self._cursor)
+            if payload is None:
+                return False
+
+            if peek_kind(payload) in self._events:
+                self._pending.append(decode(payload))
+
+        return True
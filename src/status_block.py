@@ -0,0 +1,153 @@
+"""
+State of the running countdown on a small block of shared memory, updated in
+place by the timer. Anyone can sample it at any rate without going through
+the event bus, like the status command does.
+
+The block starts with a sequence number that is odd while the timer is
+writing, so a reader retries when it finds it odd or changed after reading.
+"""
+
+from dataclasses import dataclass
+from datetime import datetime
+from multiprocessing import resource_tracker
+from multiprocessing.shared_memory import SharedMemory
+import math
+import os
+import struct
+import time
+
+from global_data import TEMPORARY_PATH
+from messages import Phase
+from utils import file_path_in_home
+
+_SEQUENCE = struct.Struct("<Q")
+# remaining seconds, phase, paused, pomodoros done, pomodoros total, end time, phase end, tag, purpose
+_FIELDS = struct.Struct("<iBBHHdd64s192s")
+_SIZE = _SEQUENCE.size + _FIELDS.size
+_READ_ATTEMPTS = 100
+
+@dataclass(frozen=True)
+class Status:
+    remaining : int
+    phase : Phase
+    paused : bool
+    pomodoros_done : int
+    pomodoros_total : int
+    end_time : float # seconds since the epoch
+    # The timer only writes when it wakes up, the time left is counted against this
+    phase_end : float = 0.0 # seconds since the epoch
+    tag : str = ""
+    purpose : str = ""
+
+class StatusBlock:
+    def __init__(self, shm, owner):
+        self._shm = shm
+        self._owner = owner
+        self._sequence = 0
+
+    def write(self, status):
+        buf = self._shm.buf
+        self._sequence += 1
+        _SEQUENCE.pack_into(buf, 0, self._sequence)
+        _FIELDS.pack_into(buf, _SEQUENCE.size,
+                          status.remaining,
+                          status.phase.value,
+                          status.paused,
+                          status.pomodoros_done,
+                          status.pomodoros_total,
+                          status.end_time,
+                          status.phase_end,
+                          (status.tag or "").encode("utf-8"),
+                          (status.purpose or "").encode("utf-8"))
+        self._sequence += 1
+        _SEQUENCE.pack_into(buf, 0, self._sequence)
+
+    def read(self):
+        buf = self._shm.buf
+        for _ in range(_READ_ATTEMPTS):
+            (before,) = _SEQUENCE.unpack_from(buf, 0)
+            fields = _FIELDS.unpack_from(buf, _SEQUENCE.size)
+            (after,) = _SEQUENCE.unpack_from(buf, 0)
+            if before == after and before % 2 == 0:
+                return _status(*fields)
+
+        raise RuntimeError("El estado del temporizador cambia demasiado rápido para leerlo")
+
+    def close(self):
+        self._shm.close()
+        if self._owner:
+            self._shm.unlink()
+            if _current_block_name() == self._shm.name:
+                os.remove(_pointer_path())
+
+def create_status_block():
+    """The block of the countdown of this process, which becomes the one the status command reads"""
+    shm = SharedMemory(name="cmd_pomodoro_status_{}".format(os.getpid()), create=True, size=_SIZE)
+    try:
+        with open(_pointer_path(), "w") as pointer:
+            pointer.write(shm.name)
+    except BaseException:
+        shm.close()
+        shm.unlink()
+        raise
+    return StatusBlock(shm, owner=True)
+
+def attach_status_block():
+    """The block of the last countdown started, None if there is none running"""
+    name = _current_block_name()
+    if name is None:
+        return None
+
+    try:
+        shm = SharedMemory(name=name)
+    except FileNotFoundError:
+        return None
+
+    # Only the owner may unlink it, the tracker would do it when this process exits
+    resource_tracker.unregister(shm._name, "shared_memory")
+    return StatusBlock(shm, owner=False)
+
+def format_status(status):
+    if status.phase == Phase.Break:
+        text = "Descanso"
+    elif status.phase == Phase.Pomodoro:
+        text = "Pomodoro {} de {}".format(status.pomodoros_done + 1, status.pomodoros_total)
+    else:
+        text = "Temporizador, {} pomodoros hechos".format(status.pomodoros_done)
+
+    seconds = status.remaining if status.paused else max(0, math.ceil(status.phase_end - time.time()))
+    remaining = "{:02d}:{:02d}:{:02d}".format(seconds // 3600, (seconds // 60) % 60, seconds % 60)
+    text += " | {} restantes".format(remaining)
+    if status.paused:
+        text += " (pausado)"
+    else:
+        text += " | termina a las {}".format(datetime.fromtimestamp(status.end_time).strftime("%H:%M"))
+
+    if status.tag:
+        text += " | #{}".format(status.tag)
+    if status.purpose:
+        text += " | {}".format(status.purpose)
+
+    return text
+
+def _status(remaining, phase, paused, done, total, end_time, phase_end, tag, purpose):
+    return Status(
+            remaining,
+            Phase(phase),
+            bool(paused),
+            done,
+            total,
+            end_time,
+            phase_end,
+            tag.rstrip(b"\0").decode("utf-8", errors="ignore"),
+            purpose.rstrip(b"\0").decode("utf-8", errors="ignore"))
+
+def _pointer_path():
+    return file_path_in_home(TEMPORARY_PATH, "status")
+
+def _current_block_name():
+    try:
+        with open(_pointer_path()) as pointer:
+            return pointer.read().strip() or None
+    except FileNotFoundError:
+        return None
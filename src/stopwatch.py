@@ -1,40 +1,79 @@
-import math
-from os import getpid
-from time import sleep
-
-from messages import print_app_msg, Event
-
-def stopwatch(msg_queue):
-    (Stopwatch(msg_queue)).run()
+from clock import SYSTEM_CLOCK
+from messages import EventBatch, print_app_msg, event_stopwatch_started, event_stopwatch_lap, event_stopwatch_stopped
 
 class Stopwatch:
-    def __init__(self, msg_queue):
-        self._seconds = 0
-        self._must_exit = False
+    """
+    Lives inside the loop that owns it, without a process or a subscription of
+    its own. It is the instant it was started on the monotonic clock and the
+    splits of its laps. Starting, taking a lap or stopping publishes what
+    happened and the screen counts the time in between by itself.
+    """
+    def __init__(self, msg_queue, clock=SYSTEM_CLOCK):
         self._msg_queue = msg_queue
-        self._pipe = msg_queue.suscribe(Event.Termination, Event.StopStopwatch, suscriber=getpid())
+        self._clock = clock
+        self._start = None
+        # Seconds since the start at the end of each lap
+        self._splits = []
+
+    def running(self):
+        return self._start is not None
+
+    def toggle(self):
+        if self.running():
+            self.stop()
+        else:
+            self.start()
+
+    def start(self):
+        self._start = self._clock.monotonic()
+        self._splits = []
+
+        with EventBatch(self._msg_queue) as batch:
+            event_stopwatch_started(batch)
+            print_app_msg(batch, "Stopwatch iniciado")
+
+    def lap(self):
+        if not self.running():
+            return
+
+        split = self._elapsed()
+        lap = split - (self._splits[-1] if self._splits else 0)
+        self._splits.append(split)
+
+        with EventBatch(self._msg_queue) as batch:
+            event_stopwatch_lap(batch, len(self._splits), _milliseconds(split), _milliseconds(lap))
+            print_app_msg(batch, "Vuelta {}: {} (total {})".format(len(self._splits), stopwatch_time(lap), stopwatch_time(split)))
 
-    def run(self):
-        print_app_msg(self._msg_queue,"Temporizador iniciado")
+    def stop(self):
+        if not self.running():
+            return
 
-        while not self._must_exit:
-            self._poll_msgs()
-            self._seconds += 1
-            sleep(1)
+        elapsed = self._elapsed()
+        self._start = None
 
-        print_app_msg(self._msg_queue,"Temporizador duro: {}".format(stopwach_msg(self._seconds)))
-        self._msg_queue.unsuscribe(getpid(),[Event.Termination,Event.StopStopwatch])
+        msg = "Stopwatch duró: {}".format(stopwatch_time(elapsed))
+        if self._splits:
+            msg += ", {} vueltas marcadas".format(len(self._splits))
 
+        with EventBatch(self._msg_queue) as batch:
+            event_stopwatch_stopped(batch, _milliseconds(elapsed), len(self._splits))
+            print_app_msg(batch, msg)
 
-    def _poll_msgs(self):
-        while self._pipe.poll():
-            msg = self._pipe.recv()
-            match msg.kind:
-                case Event.Termination | Event.StopStopwatch:
-                    self._must_exit = True
+    def _elapsed(self):
+        return self._clock.monotonic() - self._start
 
-def stopwach_msg(seconds):
-    minutes = math.ceil(seconds/60)
-    return f"{minutes} minutos" if minutes != 1 else f"{minutes} minuto"
+def stopwatch_time(seconds, tenths=True):
+    """Hours only when there are any, tenths for the times that stay on the screen"""
+    tenth = int(seconds * 10) % 10
+    minutes, second = divmod(int(seconds), 60)
+    hours, minutes = divmod(minutes, 60)
 
+    text = "{:02d}:{:02d}".format(minutes, second)
+    if hours:
+        text = "{}:{}".format(hours, text)
+    if tenths:
+        text = "{}.{}".format(text, tenth)
+    return text
 
+def _milliseconds(seconds):
+    return round(seconds * 1000)
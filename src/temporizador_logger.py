@@ -1,20 +1,28 @@
 #!/opt/cmd_pomodoro/venv/bin/python3
 
-import time
+import asyncio
+from contextlib import contextmanager
+from functools import partial
 import sys
-import multiprocessing
 import subprocess
+import time
 import select
 import logging
 
 from printer import printer
-from stopwatch import stopwatch as stopwatch_process
-from timer import timer, pomodoro
-from process_audio import audio_process, audio_process_short
+from stopwatch import Stopwatch
+from timer import timer, pomodoro, resume, agenda
+from process_audio import audio_process, audio_process_short, preload_audio
 from utils import file_path_in_home, verify_config_and_args 
 from messages import *
+from shared_memory_broker import SharedMemoryEventBroker
+from runtime import Wait, Blocking, Join, run_loop, run_loop_async, ProcessRuntime, AsyncRuntime
+from event_trace import read_trace
+from status_block import attach_status_block, format_status
+from checkpoint import load_checkpoint
 from global_data import TEMPORARY_PATH 
-from input_parser import read_input, must_config, process_config, load_config_from_file
+from log_handler import RingBufferHandler, parse_levels
+from input_parser import read_input, must_config, process_config, load_config_from_file, read_agenda
 
 def main():
     args = read_input()
@@ -22,24 +30,149 @@ def main():
         process_config(args)
         return
 
+    if args.cmd == "status":
+        print_status()
+        return
+
     config = load_config_from_file(args=args)
 
-    verify_config_and_args(args, config)
+    if args.cmd == "replay":
+        _init_logger(args)
+        replay(args, config)
+        return
+
+    checkpoint = None
+    if args.cmd == "resume":
+        checkpoint = load_checkpoint()
+        if checkpoint is None:
+            print("No hay ninguna sesión para retomar.")
+            return
+        resume_args(args, checkpoint)
+
+    if args.cmd == "agenda":
+        args.sessions = read_agenda(args)
+        for session in args.sessions:
+            verify_config_and_args(session, config)
+    else:
+        verify_config_and_args(args, config)
     
     _init_logger(args)
 
-    EventBrokerManager.register("EventBroker", EventBroker)
-    with EventBrokerManager() as manager:
-        msg_queue = manager.EventBroker()
-        (Main(args=args, config=config, msg_queue=msg_queue)).run()
+    if args.single_process:
+        try:
+            asyncio.run(run_single_process(args, config, checkpoint))
+        except KeyboardInterrupt:
+            pass
+        return
+
+    with event_broker(args) as msg_queue:
+        (Main(args=args, config=config, msg_queue=msg_queue, runtime=ProcessRuntime(), checkpoint=checkpoint)).run()
+
+async def run_single_process(args, config, checkpoint=None):
+    """Every loop of the app as a task of one event loop, talking through an in process broker"""
+    main = Main(args=args, config=config, msg_queue=_recording(EventBroker(), args), runtime=AsyncRuntime(), checkpoint=checkpoint)
+    try:
+        await run_loop_async(main.loop())
+    except asyncio.CancelledError:
+        main._finish_unsuccessfully()
+        raise
+
+@contextmanager
+def event_broker(args):
+    """Builds the event bus selected by the user for the whole session"""
+    if args.bus == "shm":
+        broker = SharedMemoryEventBroker()
+        try:
+            yield _recording(broker, args)
+        finally:
+            broker.shutdown()
+    else:
+        EventBrokerManager.register("EventBroker", EventBroker)
+        with EventBrokerManager() as manager:
+            yield _recording(manager.EventBroker(), args)
+
+def _recording(broker, args):
+    if args.record:
+        broker.record(args.record)
+    return broker
+
+def print_status():
+    block = attach_status_block()
+    if block is None:
+        print("No hay ningún temporizador en curso.")
+        return
+
+    try:
+        print(format_status(block.read()))
+    finally:
+        block.close()
+
+def resume_args(args, checkpoint):
+    """The resumed session goes on as the command that started it"""
+    args.cmd = checkpoint.kind
+    args.minutes_count = checkpoint.minutes_count
+    args.pomodoros = checkpoint.pomodoros_total
+    args.tag = checkpoint.tag or None
+    args.purpose = checkpoint.purpose or None
+
+def replay(args, config):
+    """Feeds a trace recorded with --record to a printer alone"""
+    with event_broker(args) as msg_queue:
+        # The trace goes to the printer only once it listens, all of it even at -speed 0
+        suscriber = suscriber_id("replay")
+        ready_pipe = msg_queue.suscribe(Event.PrinterReady, suscriber=suscriber)
+        printer_process = ProcessRuntime().start(printer, msg_queue, config.tags, config.display_resolution)
+        try:
+            run_loop(wait_printer_ready(ready_pipe))
+            msg_queue.unsuscribe(suscriber, [Event.PrinterReady])
+            run_loop(replay_trace(args.file, args.speed, msg_queue))
+        except KeyboardInterrupt:
+            printer_process.terminate()
+        printer_process.join()
+
+def wait_printer_ready(pipe):
+    while True:
+        yield Wait((pipe,))
+        while pipe.poll():
+            if pipe.recv().kind == Event.PrinterReady:
+                return
+
+# Asked of the printer while recording. Replayed they would open the inputs and
+# wait on the keyboard, what the user typed is already in the trace.
+_NOT_REPLAYED = {Event.AddPurpose, Event.TagChange}
+
+def replay_trace(path, speed, msg_queue):
+    """The trace counts its time from the PrinterReady it recorded, the replay from now"""
+    begin = time.monotonic()
+    ready_at = 0
+    printer_stopped = False
+    for at, data in read_trace(path):
+        msg = decode(data)
+        if msg.kind == Event.PrinterReady:
+            ready_at = at
+            continue
+        if msg.kind in _NOT_REPLAYED:
+            continue
+
+        if speed:
+            yield Wait(timeout=max(0, begin + (at - ready_at) / speed - time.monotonic()))
+
+        msg_queue.publish(msg)
+        printer_stopped = msg.kind == Event.StopPrinter
+
+    if not printer_stopped:
+        event_stop_printer(msg_queue)
 
 class Main:
-    def __init__(self, args, config, msg_queue):
+    def __init__(self, args, config, msg_queue, runtime, checkpoint=None):
         self._args = args
+        self._checkpoint = checkpoint
         self._config = config
         self._msg_queue = msg_queue
+        self._runtime = runtime
 
-        self._msg_queue_pipe = self._msg_queue.suscribe(*[event for event in Event], suscriber=getpid())
+        self._suscriber = suscriber_id("main")
+        self._msg_queue_pipe = self._msg_queue.suscribe(*[event for event in Event], suscriber=self._suscriber)
 
         self._can_pause = config.can_pause_pomodoros
         self._paused = False
@@ -47,60 +180,89 @@ class Main:
         self._in_input_state = False
 
         self._audio_process = None
-        self._stopwatch_process = None
+        self._stopwatch = Stopwatch(self._msg_queue)
         self._printer_process = self._start_printer()
         self._timer_process = self._start_timer()
 
     def run(self):
         try:
-            while not self._must_finish:
-                self._poll_events()
-
-                self._handle_cmds_pressed_if_any()
-
+            run_loop(self.loop())
         except KeyboardInterrupt:
             self._finish_unsuccessfully()
+            run_loop(self._finish_gracefully())
+
+    def loop(self):
+        if self._args.cmd == "agenda":
+            # Every session of the agenda plays them, the audio processes start with them decoded
+            yield Blocking(partial(preload_audio, self._config.path_pc, self._config.between_pomodoros_sound, self._config.audio_pomodoro_break_finish))
+
+        while not self._must_finish:
+            keys = (sys.stdin,) if self._get_input_keys() else ()
+            ready = yield Wait((self._msg_queue_pipe,), keys)
+
+            yield from self._poll_events()
 
-        self._finish_gracefully()
+            if sys.stdin in ready:
+                yield from self._handle_cmds_pressed_if_any()
+
+        yield from self._finish_gracefully()
 
     def _start_printer(self):
-        printer_process = multiprocessing.Process(
-                    target=printer, 
-                    args=(self._msg_queue,self._config.tags))
-        printer_process.start()
-        return printer_process
+        return self._runtime.start(printer, self._msg_queue, self._config.tags, self._config.display_resolution)
 
     def _start_timer(self):
+        if self._checkpoint:
+            self._init_mode()
+            return self._runtime.start(resume, self._checkpoint, self._config.path_to_log, self._msg_queue, self._config.display_resolution, self._config.log_fsync)
+
+        if self._args.cmd == "agenda":
+            return self._runtime.start(
+                    agenda,
+                    self._args.sessions,
+                    self._config.pomodoro_time,
+                    self._config.pomodoro_break_duration,
+                    self._config.path_to_log,
+                    self._msg_queue,
+                    self._config.display_resolution,
+                    self._config.log_fsync)
+
         if self._args.cmd == "timer":
-            event_timer_init(self._msg_queue)
-            self._can_pause = True
-            timer_process = multiprocessing.Process(
-                    target=timer, 
-                    args=(self._args.minutes_count, 
-                          self._args.tag, 
-                          self._config.path_to_log, 
-                          self._config.pomodoro_time, 
-                          self._msg_queue,
-                          self._args.purpose))
+            self._init_mode()
+            return self._runtime.start(
+                    timer,
+                    self._args.minutes_count, 
+                    self._args.tag, 
+                    self._config.path_to_log, 
+                    self._config.pomodoro_time, 
+                    self._msg_queue,
+                    self._args.purpose,
+                    self._args.reminder,
+                    self._config.display_resolution,
+                    self._config.log_fsync)
 
         elif self._args.cmd == "pomodoro":
-            event_pomodoro_init(self._msg_queue)
-            timer_process = multiprocessing.Process(
-                    target=pomodoro,
-                    args=(self._args.pomodoros,
-                          self._args.tag,
-                          self._config.pomodoro_time,
-                          self._config.pomodoro_break_duration,
-                          self._config.path_to_log,
-                          self._msg_queue,
-                          self._args.purpose)) 
+            self._init_mode()
+            return self._runtime.start(
+                    pomodoro,
+                    self._args.pomodoros,
+                    self._args.tag,
+                    self._config.pomodoro_time,
+                    self._config.pomodoro_break_duration,
+                    self._config.path_to_log,
+                    self._msg_queue,
+                    self._args.purpose,
+                    self._args.reminder,
+                    self._config.display_resolution,
+                    self._config.log_fsync)
 
         else:
             raise RuntimeError("Comando {} desconocido")
 
-        timer_process.start()
-
-        return timer_process
+    def _init_mode(self):
+        if self._args.cmd == "timer":
+            event_timer_init(self._msg_queue)
+        else:
+            event_pomodoro_init(self._msg_queue)
 
     def _poll_events(self):
         while self._msg_queue_pipe.poll():
@@ -111,39 +273,39 @@ class Main:
                     self._must_finish = True
 
                 case Event.TimerFinished:
-                    publish_notification(finished_info_msg(self._args))
+                    yield Blocking(partial(publish_notification, finished_info_msg(self._args)))
                     event_playback(self._msg_queue)
-                    self._audio_process = play_audio_on_subprocess(self._args, self._config.path_pc, self._msg_queue)
-                    event_stop_stopwatch(self._msg_queue)
+                    self._audio_process = self._runtime.start(audio_process, self._args, self._config.path_pc, self._msg_queue)
+                    self._stopwatch.stop()
 
                 case Event.AudioPomodoroFinished:
                     event_playback(self._msg_queue)
-                    (multiprocessing.Process(
-                        target=audio_process_short, 
-                        args=(
-                            self._args, 
-                            self._config.between_pomodoros_sound, 
-                            self._msg_queue))).start()
+                    self._runtime.start(audio_process_short, self._args, self._config.between_pomodoros_sound, self._msg_queue)
 
                 case Event.BreakFinished:
                     event_playback(self._msg_queue)
-                    (multiprocessing.Process(
-                        target=audio_process_short, 
-                        args=(
-                            self._args, 
-                            self._config.audio_pomodoro_break_finish, 
-                            self._msg_queue))).start()
+                    self._runtime.start(audio_process_short, self._args, self._config.audio_pomodoro_break_finish, self._msg_queue)
 
                 case Event.AudioEnded:
-                    event_audio_stopped(self._msg_queue)
-                    print_app_msg(self._msg_queue, "Felicitaciones por el período de estudio! Te mereces un descanso.")
-                    event_terminate(self._msg_queue)
+                    with EventBatch(self._msg_queue) as batch:
+                        event_audio_stopped(batch)
+                        print_app_msg(batch, "Felicitaciones por el período de estudio! Te mereces un descanso.")
+                        event_terminate(batch)
                     self._must_finish = True
-                    time.sleep(2)
+                    yield Wait(timeout=2)
 
                 case Event.PurposeFinished | Event.TagFinished:
                     self._in_input_state = False
 
+                case Event.TimerInit:
+                    self._can_pause = True
+
+                case Event.PomodoroInit:
+                    self._can_pause = self._config.can_pause_pomodoros
+
+                case Event.SessionBegin:
+                    self._paused = False
+
                 case _:
                     pass
 
@@ -170,21 +332,17 @@ class Main:
                 print_cmd_msg(self._msg_queue,"f")
                 if self._audio_process:
                     event_audio_terminate(self._msg_queue)
-                    self._audio_process.join()
+                    yield Join(self._audio_process)
                 else:
                     event_terminate(self._msg_queue)
             
             case "t":
                 print_cmd_msg(self._msg_queue,"t")
-                if self._stopwatch_process:
-                    event_stop_stopwatch(self._msg_queue)
-                    self._stopwatch_process.join()
-                    self._stopwatch_process = None
-                else:
-                    self._stopwatch_process = multiprocessing.Process(
-                        target=stopwatch_process, 
-                        args=(self._msg_queue,))
-                    self._stopwatch_process.start()
+                self._stopwatch.toggle()
+
+            case "l":
+                print_cmd_msg(self._msg_queue,"l")
+                self._stopwatch.lap()
             
             case "i":
                 print_cmd_msg(self._msg_queue, "i")
@@ -195,6 +353,10 @@ class Main:
                 print_cmd_msg(self._msg_queue, "r")
                 event_tag_change(self._msg_queue)
                 self._in_input_state = True
+
+            case "n":
+                print_cmd_msg(self._msg_queue, "n")
+                event_focus_next(self._msg_queue)
             
             case _:
                 pass
@@ -203,18 +365,20 @@ class Main:
         return not self._in_input_state
 
     def _finish_gracefully(self):
-        self._timer_process.join()
+        yield Join(self._timer_process)
 
-        if self._stopwatch_process:
-            self._stopwatch_process.join()
+        self._stopwatch.stop()
 
         if self._audio_process:
-            self._audio_process.join()
+            yield Join(self._audio_process)
 
         event_stop_printer(self._msg_queue)
-        self._printer_process.join()
+        yield Join(self._printer_process)
+
+        if self._args.debug:
+            logging.getLogger(".main").debug(format_metrics(self._msg_queue.metrics()))
 
-        self._msg_queue.unsuscribe(getpid(), [event for event in Event])
+        self._msg_queue.unsuscribe(self._suscriber, [event for event in Event])
 
     def _finish_unsuccessfully(self):
         #event_terminate(self._msg_queue)
@@ -222,13 +386,10 @@ class Main:
         self._printer_process.terminate()
         self._timer_process.terminate()
 
-        if self._stopwatch_process:
-            self._stopwatch_process.terminate()
-
         if self._audio_process:
             self._audio_process.terminate()
 
-        self._msg_queue.unsuscribe(getpid(), [event for event in Event])
+        self._msg_queue.unsuscribe(self._suscriber, [event for event in Event])
 
 def get_key():
     """Lee una tecla de manera no bloqueante."""
@@ -242,6 +403,12 @@ def publish_notification(msgs):
     subprocess.run(["notify-send", *msgs, "-a", "cmd_pomodoro", "-t", "60"])
 
 def finished_info_msg(args):
+    if args.cmd == "agenda":
+        return [
+                "Finalizaron las {} sesiones de la agenda.".format(len(args.sessions)),
+                "Felicitaciones por el período de estudio! Te mereces un descanso."
+                ]
+
     if args.cmd == "timer":
         summary_msg = "Finalizó el temporizador de {} minutos".format(args.minutes_count)
     else:
@@ -257,16 +424,16 @@ def finished_info_msg(args):
             "Felicitaciones por el período de estudio! Te mereces un descanso."
             ]
 
-def play_audio_on_subprocess(args, audio_track_path, msg_queue):
-    process = multiprocessing.Process(target=audio_process, args=(args, audio_track_path, msg_queue))
-    process.start()
-    return process
-
 def _init_logger(args):
+    handler = RingBufferHandler(file_path_in_home(TEMPORARY_PATH,"cmd_pomodoro.log"))
+    handler.setFormatter(logging.Formatter(logging.BASIC_FORMAT))
     logging.basicConfig(
             level=logging.DEBUG if args.debug else logging.INFO,
-            filename=file_path_in_home(TEMPORARY_PATH,"cmd_pomodoro.log"), 
-            filemode="a+")
+            handlers=[handler])
+
+    for subsystem, level in parse_levels(args.log_level).items():
+        logging.getLogger(subsystem).setLevel(level)
+
     logger = logging.getLogger(".main")
     logger.info("LOGGING SETTED UP")
 
@@ -1,83 +1,257 @@
 from abc import abstractmethod
-from datetime import datetime, timedelta
-import time
-from os import getpid
+from datetime import timedelta
+import logging
+import math
 
+from checkpoint import Checkpoint, create_checkpoint, discard_checkpoint
+from clock import SYSTEM_CLOCK
 from messages import *
-from utils import path_to_file
+from pomodoro_log import PomodoroLog
+from runtime import Blocking, Wait
+from session_plan import SessionPlan
+from status_block import Status, create_status_block
+from timing_wheel import TimingWheel
 
-def timer(minutes_count, tag, log_file, pomodoro_time, msg_queue, purpose):
+def timer(minutes_count, tag, log_file, pomodoro_time, msg_queue, purpose, reminders=(), resolution=Resolution.Seconds, log_fsync="never", clock=SYSTEM_CLOCK):
     """Timer process manages the pomodoros and the logging of them"""
-    
-    (Timer(minutes_count=minutes_count,
+    log = PomodoroLog(log_file, log_fsync)
+    return _host(msg_queue, [(Timer(minutes_count=minutes_count,
            msg_queue=msg_queue,
            pomodoro_time=pomodoro_time,
-           log_file=log_file,
+           log=log,
            tag=tag,
-           purpose=purpose)).run()
+           purpose=purpose,
+           clock=clock), reminders)], log, resolution, clock).loop()
 
-def pomodoro(pomodoros, tag, pomodoro_time, pomodoro_break_duration, path_to_log, msg_queue, purpose):
-    (Pomodoro(pomodoros=pomodoros,
+def pomodoro(pomodoros, tag, pomodoro_time, pomodoro_break_duration, path_to_log, msg_queue, purpose, reminders=(), resolution=Resolution.Seconds, log_fsync="never", clock=SYSTEM_CLOCK):
+    log = PomodoroLog(path_to_log, log_fsync)
+    return _host(msg_queue, [(Pomodoro(pomodoros=pomodoros,
            msg_queue=msg_queue,
            pomodoro_time=pomodoro_time,
-           log_file=path_to_log,
+           log=log,
            tag=tag,
            pomodoro_break_duration=pomodoro_break_duration,
-           purpose=purpose)).run()
-
-class Countdown:
-    pass
-    def __init__(self,
-                 msg_queue,
-                 log_file,
-                 tag,
-                 purpose,
-                 pomodoro_time):
-        self._msg_queue=msg_queue
-        self._pipe = self._msg_queue.suscribe(*[event for event in Event], suscriber=getpid())
-
-        self._log_file=log_file
-        self._tag=tag
-        self._purpose = purpose
-        self._pomodoro_time = pomodoro_time
-
+           purpose=purpose,
+           clock=clock), reminders)], log, resolution, clock).loop()
+
+def agenda(sessions, pomodoro_time, pomodoro_break_duration, path_to_log, msg_queue, resolution=Resolution.Seconds, log_fsync="never", clock=SYSTEM_CLOCK):
+    """
+    Runs the sessions one after the other on the same host, with the same
+    screen and log, each one as the timer or pomodoro command it was given as.
+    """
+    log = PomodoroLog(path_to_log, log_fsync)
+
+    def countdowns():
+        for number, session in enumerate(sessions, 1):
+            with EventBatch(msg_queue) as batch:
+                if 1 < number:
+                    event_audio_pomodoro_finished(batch)
+                event_session_begin(batch, number, len(sessions))
+                if session.cmd == "timer":
+                    event_timer_init(batch)
+                else:
+                    event_pomodoro_init(batch)
+                print_app_msg(batch, "Sesión {} de {} de la agenda.".format(number, len(sessions)))
+
+            if session.cmd == "timer":
+                countdown = Timer(session.minutes_count, msg_queue, pomodoro_time, log, session.tag, session.purpose, clock)
+            else:
+                countdown = Pomodoro(session.pomodoros, msg_queue, pomodoro_time, log, session.tag, pomodoro_break_duration, session.purpose, clock)
+            yield countdown, session.reminder
+
+    return _host(msg_queue, countdowns(), log, resolution, clock).loop()
+
+def resume(checkpoint, path_to_log, msg_queue, resolution=Resolution.Seconds, log_fsync="never", clock=SYSTEM_CLOCK):
+    """Continues the session of the checkpoint where it was left"""
+    log = PomodoroLog(path_to_log, log_fsync)
+    if checkpoint.kind == "timer":
+        countdown = Timer(minutes_count=checkpoint.minutes_count,
+               msg_queue=msg_queue,
+               pomodoro_time=checkpoint.pomodoro_time,
+               log=log,
+               tag=checkpoint.tag,
+               purpose=checkpoint.purpose,
+               clock=clock)
+    else:
+        countdown = Pomodoro(pomodoros=checkpoint.pomodoros_total,
+               msg_queue=msg_queue,
+               pomodoro_time=checkpoint.pomodoro_time,
+               log=log,
+               tag=checkpoint.tag,
+               pomodoro_break_duration=checkpoint.break_duration,
+               purpose=checkpoint.purpose,
+               clock=clock)
+
+    countdown._restore(checkpoint)
+    host = _host(msg_queue, [(countdown, ())], log, resolution, clock)
+    # Still resumable if it dies before the printer is ready, from the checkpoint of this session
+    host.save_checkpoint(countdown)
+    discard_checkpoint(checkpoint.path)
+    return host.loop()
+
+def _host(msg_queue, sessions, log, resolution, clock):
+    """The host of the sessions, the log is closed if it can't be built"""
+    try:
+        return CountdownHost(msg_queue, sessions, log, resolution, clock)
+    except BaseException:
+        log.close()
+        raise
+
+class CountdownHost:
+    """
+    Runs every countdown of the session on a single loop, the main one and the
+    reminders. Each countdown tells when it next has something to do and a
+    timing wheel wakes the loop once per due deadline, instead of a loop per
+    countdown sleeping a second at a time.
+
+    The focused countdown is also woken up when what the screen shows of it
+    changes at the display resolution, and only then a tick is published. In
+    minutes that is a tick a minute instead of one a second.
+
+    The sessions run one after the other, each with its main countdown and
+    its reminders. The pause, resume and cancel events name the countdown
+    they are for, the main one has the empty name. The screen shows the focused countdown while
+    the status block and the checkpoint follow the main one.
+    """
+    _EVENTS = [Event.PrinterReady, Event.StopTimer, Event.ResumeTimer, Event.CancelTimer, Event.FocusNext, Event.Termination, Event.PurposeAdded, Event.TagChanged]
+    # Seconds of the session a crash can lose at most, the checkpoint is written at every wake up
+    _CHECKPOINT_INTERVAL = 10
+
+    def __init__(self, msg_queue, sessions, log=None, resolution=Resolution.Seconds, clock=SYSTEM_CLOCK):
+        self._msg_queue = msg_queue
+        self._clock = clock
+        self._suscriber = suscriber_id("countdown")
+        self._pipe = self._msg_queue.suscribe(*self._EVENTS, suscriber=self._suscriber)
+        self._logger = logging.getLogger(".timer")
+
+        self._sessions = iter(sessions)
+        self._log = log
+        self._main = None
+        self._countdowns = {}
+        self._focused = None
+        self._resolution = resolution
+        self._shown = None
+
+        self._wheel = TimingWheel(clock.monotonic())
+        self._timeouts = {}
 
         self._wait_printer = True
-        self._paused = False
         self._must_exit = False
-
-        self._seconds = 0
-
-        if tag:
-            event_tag_setted(msg_queue,tag)
-        if purpose:
-            event_purpose_setted(msg_queue, purpose)
-
-    def run(self):
+        self._status_block = create_status_block()
+        try:
+            self._checkpoint = create_checkpoint()
+        except BaseException:
+            self._status_block.close()
+            raise
+
+    def loop(self):
+        ended = False
+        log_closed = self._log is None
+        try:
+            for main, reminders in self._sessions:
+                self._load(main, reminders)
+                yield from self._run()
+                if self._must_exit:
+                    break
+            ended = True
+
+            if self._log:
+                # Off the loop, under asyncio it would hold every task on the disk
+                yield Blocking(self._log.close)
+                log_closed = True
+        finally:
+            self._status_block.close()
+            # Killed or interrupted, the session stays there to be resumed
+            self._checkpoint.close(discard=ended)
+            if not log_closed:
+                # Interrupted, the loop is going away and whatever is queued still gets written
+                self._log.close()
+
+        self._msg_queue.unsuscribe(self._suscriber, self._EVENTS)
+        if not self._must_exit:
+            event_timer_finished(self._msg_queue)
+
+    def _load(self, main, reminders):
+        # The reminders of the previous session end with it
+        for countdown in self._countdowns.values():
+            self._unschedule(countdown)
+
+        self._main = main
+        self._countdowns = {main.name: main}
+        for name, minutes in reminders:
+            self._countdowns[name] = Reminder(name, minutes, self._msg_queue, self._clock)
+        self._focused = main
+        self._shown = None
+
+    def _run(self):
         while self._wait_printer:
+            yield Wait((self._pipe,))
             self._poll_pipe()
-            
-        self._event_ready()
-
-        while self._finished(): 
-            self._poll_pipe()
-
-            if self._paused:
-                time.sleep(0.5)
-                continue
-
-            if self._must_exit:
-                return
 
-            self._print_seconds_to_screen()
-            
-            time.sleep(1)
-            self._seconds -= 1
-
-            self._on_second_passed()
-
-        self._msg_queue.unsuscribe(getpid(), [event for event in Event])
-        event_timer_finished(self._msg_queue)
+        now = self._clock.monotonic()
+        for countdown in self._countdowns.values():
+            countdown.start()
+            if countdown.paused:
+                # Paused while the printer got ready, it stays where it is
+                countdown.pause()
+            else:
+                self._schedule(countdown, now)
+
+        with EventBatch(self._msg_queue) as batch:
+            event_timer_initiated(batch, self._main.end_time())
+            self._show(batch, now)
+        self._save_state()
+
+        while not self._must_exit and self._main.running():
+            deadline = self._wheel.next_deadline()
+            timeout = None if deadline is None else max(0, deadline - self._clock.monotonic())
+            if (yield Wait((self._pipe,), timeout=timeout)):
+                self._poll_pipe()
+
+            if not self._must_exit:
+                self._tick_due()
+
+    def _tick_due(self):
+        now = self._clock.monotonic()
+        due = [(countdown, self._timeouts.pop(countdown.name).deadline) for countdown in self._wheel.pop_due(now)]
+        for countdown, deadline in due:
+            # Due for the wheel is due, even when its rounding woke us a hair early
+            at = max(now, deadline)
+            countdown.catch_up(at)
+
+            if countdown.running():
+                self._schedule(countdown, at)
+                if countdown is self._focused:
+                    self._show(self._msg_queue, at)
+            elif countdown is not self._main:
+                self._finish(countdown)
+
+        if due:
+            self._save_state()
+
+    def _schedule(self, countdown, now):
+        deadline = countdown.next_deadline(now, self._resolution if countdown is self._focused else None)
+        if countdown is self._main:
+            deadline = min(deadline, now + self._CHECKPOINT_INTERVAL)
+        self._unschedule(countdown)
+        self._timeouts[countdown.name] = self._wheel.schedule(deadline, countdown)
+
+    def _unschedule(self, countdown):
+        timeout = self._timeouts.pop(countdown.name, None)
+        if timeout:
+            self._wheel.cancel(timeout)
+
+    def _show(self, msg_queue, now):
+        """Ticks the focused countdown, unless the screen already shows that"""
+        tick = self._focused.tick(now, self._resolution)
+        if tick != self._shown:
+            self._shown = tick
+            print_time(msg_queue, *tick)
+
+    def _finish(self, countdown):
+        del self._countdowns[countdown.name]
+        if countdown is self._focused:
+            self._focus(self._main)
 
     def _poll_pipe(self):
         while self._pipe.poll():
@@ -88,38 +262,244 @@ class Countdown:
                     self._wait_printer = False
 
                 case Event.StopTimer:
-                    self._paused = True
-                    event_timer_stopped(self._msg_queue)
-                    print_app_msg(self._msg_queue,"Cuenta atrás pausada.")
+                    self._pause(self._named(msg.msg))
 
                 case Event.ResumeTimer:
-                    self._paused = False
-                    event_timer_resumed(self._msg_queue, self._finish_time())
-                    print_app_msg(self._msg_queue,"Cuenta atrás reanudada.")
+                    self._resume(self._named(msg.msg))
+
+                case Event.CancelTimer:
+                    self._cancel(self._named(msg.msg))
+
+                case Event.FocusNext:
+                    names = list(self._countdowns)
+                    self._focus(self._countdowns[names[(names.index(self._focused.name) + 1) % len(names)]])
 
                 case Event.Termination:
                     self._must_exit = True
 
                 case Event.PurposeAdded:
-                    self._purpose = msg.msg
+                    self._main.change_purpose(msg.msg)
 
                 case Event.TagChanged:
-                    self._tag = msg.msg
+                    self._main.change_tag(msg.msg)
+
+                case _:
+                    continue
+
+            self._save_state()
+
+    def _named(self, name):
+        countdown = self._countdowns.get(name or "")
+        if countdown is None:
+            self._logger.warning("There is no countdown named %s", name)
+        return countdown
+
+    def _pause(self, countdown):
+        if countdown is None or countdown.paused:
+            return
+
+        countdown.pause()
+        self._unschedule(countdown)
+        with EventBatch(self._msg_queue) as batch:
+            if countdown is self._main:
+                event_timer_stopped(batch)
+            if countdown is self._focused:
+                self._show(batch, self._clock.monotonic())
+            print_app_msg(batch, countdown.describe("pausada"))
+
+    def _resume(self, countdown):
+        if countdown is None or not countdown.paused:
+            return
+
+        now = self._clock.monotonic()
+        countdown.resume()
+        self._schedule(countdown, now)
+        with EventBatch(self._msg_queue) as batch:
+            if countdown is self._main:
+                event_timer_resumed(batch, countdown.end_time())
+            if countdown is self._focused:
+                self._show(batch, now)
+            print_app_msg(batch, countdown.describe("reanudada"))
+
+    def _cancel(self, countdown):
+        if countdown is None:
+            return
+
+        if countdown is self._main:
+            # Same as finishing the session from the keyboard
+            event_terminate(self._msg_queue)
+            return
+
+        self._unschedule(countdown)
+        print_app_msg(self._msg_queue, countdown.describe("cancelada"))
+        self._finish(countdown)
+
+    def _focus(self, countdown):
+        self._focused = countdown
+        now = self._clock.monotonic()
+        if not countdown.paused:
+            # Now it also has to wake up for the screen
+            self._schedule(countdown, now)
+
+        # The tick names the focused countdown and says if it is paused, the end time is always the main one's
+        self._show(self._msg_queue, now)
+
+    def save_checkpoint(self, countdown):
+        self._checkpoint.write(countdown.checkpoint())
+
+    def _save_state(self):
+        self._status_block.write(self._main.status())
+        self._checkpoint.write(self._main.checkpoint())
+
+class Countdown:
+    """
+    State of one countdown, driven by CountdownHost. The plan of the session
+    says when each phase ends and each pomodoro is done, the countdown goes
+    from one boundary to the next and acts on each.
+    """
+    def __init__(self,
+                 msg_queue,
+                 log,
+                 tag,
+                 purpose,
+                 pomodoro_time,
+                 plan,
+                 clock=SYSTEM_CLOCK,
+                 name=""):
+        self._msg_queue=msg_queue
+        self._clock = clock
+        self.name = name
 
-    def _print_seconds_to_screen(self):
-        print_time(self._msg_queue, self._print_pending_time_msg())
+        self._log = log
+        self._tag=tag
+        self._purpose = purpose
+        self._pomodoro_time = pomodoro_time
 
-    def _print_pending_time_msg(self):
-        s=self._seconds
-        return "{:02d}:{:02d}:{:02d}".format(s//3600, (s//60) % 60, s % 60)
+        self.paused = False
+        self._plan = plan
+        # Second of the session of the last boundary acted on
+        self._reached = 0
 
-    def _log_to_file(self, now):
-        text = self.pomo_log_line_entry(now)
-        with open(path_to_file(self._log_file), "a") as log:
-            log.write("\n" + text )
-            
-    def _print_pomodoro_finished(self, now):
-        print_app_msg(self._msg_queue, self.pomo_log_line_entry(now))
+        if tag:
+            event_tag_setted(msg_queue,tag)
+        if purpose:
+            event_purpose_setted(msg_queue, purpose)
+
+    def start(self):
+        self._plan.start(self._clock.monotonic())
+
+    def running(self):
+        return self._reached < self._plan.seconds
+
+    def catch_up(self, now):
+        """
+        Acts on the boundaries of the session that are due. Usually one, more
+        when the loop was held up for longer.
+        """
+        while self.running():
+            boundary = self._plan.next_boundary(self._reached)
+            if now < self._plan.at(boundary):
+                return
+
+            previous, self._reached = self._reached, boundary
+            self._on_boundary(previous, boundary)
+
+    def next_deadline(self, now, resolution=None):
+        """
+        When the countdown has something to do next, given that it is running
+        at now. With a resolution, also when what the screen shows changes.
+        """
+        deadline = self._plan.at(self._plan.next_boundary(self._reached))
+        if resolution:
+            phase_end = self._plan.at(self._plan.phase_end(self._reached))
+            shown = resolution.units_left(phase_end - now)
+            if 0 < shown:
+                deadline = min(deadline, phase_end - round((shown - 1) * resolution.value, 6))
+        return deadline
+
+    def pause(self):
+        self.paused = True
+        self._plan.pause(self._clock.monotonic())
+
+    def resume(self):
+        self.paused = False
+        self._plan.resume(self._clock.monotonic())
+
+    def change_tag(self, tag):
+        self._tag = tag
+
+    def change_purpose(self, purpose):
+        self._purpose = purpose
+
+    def end_time(self):
+        return self._finish_time_format(self._plan.time_to_end(self._clock.monotonic()))
+
+    def tick(self, now, resolution):
+        """What the screen shows of the countdown at now"""
+        return resolution.units_left(self._phase_left(now)), self._phase(), self.name, self.paused
+
+    def describe(self, state):
+        return "Cuenta atrás {}{}.".format(self.name + " " if self.name else "", state)
+
+    def _phase(self):
+        return self._plan.phase(self._reached)
+
+    def _phase_left(self, now=None):
+        now = self._clock.monotonic() if now is None else now
+        return self._plan.phase_end(self._reached) - self._plan.elapsed(now)
+
+    def _pomodoros_done(self):
+        return self._plan.pomodoros_done(self._reached)
+
+    def status(self):
+        now = self._clock.monotonic()
+        phase_left = self._phase_left(now)
+        return Status(
+            remaining=math.ceil(phase_left),
+            phase_end=self._clock.time() + phase_left,
+            phase=self._phase(),
+            paused=self.paused,
+            pomodoros_done=self._pomodoros_done(),
+            pomodoros_total=self._plan.pomodoros,
+            end_time=self._clock.time() + self._plan.time_to_end(now),
+            tag=self._tag,
+            purpose=self._purpose)
+
+    def checkpoint(self):
+        phase_left = self._phase_left()
+        return Checkpoint(
+            kind=self._KIND,
+            seconds=math.ceil(phase_left),
+            remaining=phase_left,
+            pomodoros_done=self._pomodoros_done(),
+            pomodoros_total=self._plan.pomodoros,
+            pomodoro_time=self._pomodoro_time,
+            tag=self._tag,
+            purpose=self._purpose,
+            **self._session_state())
+
+    def _restore(self, checkpoint):
+        """Picks up where the checkpoint left, the time the app was down doesn't count"""
+        elapsed = self._plan.phase_end(self._phase_start(checkpoint)) - checkpoint.remaining
+        self._plan.skip_to(elapsed)
+        self._reached = elapsed
+
+        with EventBatch(self._msg_queue) as batch:
+            # The status bar counts the finished pomodoros one by one
+            for _ in range(checkpoint.pomodoros_done):
+                event_pomodoro_finished(batch)
+            if checkpoint.on_break:
+                event_break_begin(batch)
+            print_app_msg(batch, "Sesión reanudada.")
+
+    def _print_pomodoro_finished(self, msg_queue, now):
+        print_app_msg(msg_queue, self.pomo_log_line_entry(now))
+
+    def _pomodoro_finished(self, msg_queue):
+        now = self._clock.now()
+        self._log.write(self.pomo_log_line_entry(now))
+        self._print_pomodoro_finished(msg_queue, now)
+        event_pomodoro_finished(msg_queue)
 
     def pomo_log_line_entry(self, now):
         date = now.strftime("%y-%m-%d")
@@ -135,123 +515,105 @@ class Countdown:
 
         return text
 
-    def _event_ready(self):
-        time_str = self._finish_time_format(self._finish_time())
-        event_timer_initiated(self._msg_queue, time_str)
-
     def _finish_time_format(self, pending_seconds):
-        t = datetime.now() + timedelta(seconds=pending_seconds)
+        t = self._clock.now() + timedelta(seconds=pending_seconds)
         return "{:02d}:{:02d}".format(t.hour, t.minute)
 
-    @abstractmethod
-    def _on_second_passed(self):
-        raise RuntimeError("Must be overriden")
+    def _phase_start(self, checkpoint):
+        """Second of the session where the phase of the checkpoint began"""
+        return 0
 
     @abstractmethod
-    def _finished(self):
+    def _on_boundary(self, previous, boundary):
+        """Reached the boundary of the plan that follows the previous one"""
         raise RuntimeError("Must be overriden")
 
     @abstractmethod
-    def _finish_time(self):
+    def _session_state(self):
+        """Fields of the checkpoint particular to the kind of countdown"""
         raise RuntimeError("Must be overriden")
 
 class Pomodoro(Countdown):
+    _KIND = "pomodoro"
+
     def __init__(self, 
                  pomodoros,
                  msg_queue, 
                  pomodoro_time,
-                 log_file,
+                 log,
                  tag,
                  pomodoro_break_duration,
-                 purpose):
-        super().__init__(msg_queue, log_file, tag, purpose, pomodoro_time)
+                 purpose,
+                 clock=SYSTEM_CLOCK):
+        plan = SessionPlan(
+                pomodoros * pomodoro_time * 60 + (pomodoros - 1) * pomodoro_break_duration * 60,
+                pomodoro_time * 60,
+                pomodoro_break_duration * 60)
+        super().__init__(msg_queue, log, tag, purpose, pomodoro_time, plan, clock)
 
-        self._pomodoro_time=pomodoro_time
-        self._pomodoros=pomodoros
         self._pomodoro_break_duration=pomodoro_break_duration
 
-        self._on_break = False
-        self._seconds = self._pomodoro_time * 60
-
         event_pomodoro_setted(msg_queue, pomodoros)
 
-    def _finished(self):
-        return 0 != self._pomodoros
-    
-    def _on_second_passed(self):
-        if self._is_pomodoro_ended():
-            now = datetime.now()
-            self._log_to_file(now)
-            self._print_pomodoro_finished(now)
-
-            event_pomodoro_finished(self._msg_queue)
-            self._pomodoros -= 1
-
-            if self._pomodoros != 0: 
-                self._set_break()
-
-        elif self._is_break_ended():
-            event_break_finished(self._msg_queue)
-            self._set_pomodoro()
-
-    def _finish_time(self):
-        pending_breaks = (self._pomodoros - 1) * self._pomodoro_break_duration * 60
-        pending_pomodoros = (self._pomodoros - 1) * self._pomodoro_time
-        return self._seconds + pending_breaks + pending_pomodoros
-
-    def _set_pomodoro(self):
-        self._on_break = False
-        self._seconds = self._pomodoro_time * 60
-        event_pomodoro_begin(self._msg_queue)
-        
-    def _set_break(self):
-        self._on_break = True
-        self._seconds = self._pomodoro_break_duration * 60
-        event_audio_pomodoro_finished(self._msg_queue)
-        event_break_begin(self._msg_queue)
-
-    def _is_pomodoro_ended(self):
-        return not self._on_break and self._seconds == 0
-
-    def _is_break_ended(self):
-        return self._on_break and self._seconds == 0
+    def _on_boundary(self, previous, boundary):
+        with EventBatch(self._msg_queue) as batch:
+            if self._plan.phase(previous) == Phase.Pomodoro:
+                self._pomodoro_finished(batch)
+
+                if self.running():
+                    event_audio_pomodoro_finished(batch)
+                    event_break_begin(batch)
+
+            else:
+                event_break_finished(batch)
+                event_pomodoro_begin(batch)
+
+    def _session_state(self):
+        return dict(on_break=self._phase() == Phase.Break, break_duration=self._pomodoro_break_duration)
+
+    def _phase_start(self, checkpoint):
+        return self._plan.phase_start(checkpoint.pomodoros_done, checkpoint.on_break)
 
 class Timer(Countdown):
+    _KIND = "timer"
+
     def __init__(self, 
                  minutes_count, 
                  msg_queue, 
                  pomodoro_time,
-                 log_file,
+                 log,
                  tag,
-                 purpose):
-        super().__init__(msg_queue, log_file, tag, purpose, pomodoro_time)
+                 purpose,
+                 clock=SYSTEM_CLOCK):
+        super().__init__(msg_queue, log, tag, purpose, pomodoro_time, SessionPlan(minutes_count * 60, pomodoro_time * 60), clock)
 
-        self._seconds=minutes_count*60
-        self._pomodoro_time=pomodoro_time
-        self._since_last_pomodoro = 0
+        self._minutes_count = minutes_count
 
-        event_pomodoro_setted(msg_queue, minutes_count // pomodoro_time)
+        event_pomodoro_setted(msg_queue, self._plan.pomodoros)
 
-    def _finished(self):
-        return 0 <= self._seconds
+    def _on_boundary(self, previous, boundary):
+        if self._plan.pomodoros_done(previous) == self._plan.pomodoros_done(boundary):
+            return
 
-    def _finish_time(self):
-        return self._seconds
+        with EventBatch(self._msg_queue) as batch:
+            self._pomodoro_finished(batch)
 
-    def _on_second_passed(self):
-        if self._is_pomodoro_ended():
-            now = datetime.now()
-            self._log_to_file(now)
-            self._print_pomodoro_finished(now)
-            event_pomodoro_finished(self._msg_queue)
+            if self.running():
+                event_audio_pomodoro_finished(batch)
 
-            if 0 < self._seconds:
-                event_audio_pomodoro_finished(self._msg_queue)
+    def _session_state(self):
+        since_last_pomodoro = self._plan.elapsed(self._clock.monotonic()) - self._pomodoros_done() * self._pomodoro_time * 60
+        return dict(since_last_pomodoro=int(since_last_pomodoro), minutes_count=self._minutes_count)
 
-            self._since_last_pomodoro = 0
+class Reminder(Countdown):
+    """Countdown beside the main one that only lets know when it is due"""
+    def __init__(self, name, minutes, msg_queue, clock=SYSTEM_CLOCK):
+        super().__init__(msg_queue, None, None, None, None, SessionPlan(minutes * 60), clock, name)
 
-        self._since_last_pomodoro += 1
+    def _on_boundary(self, previous, boundary):
+        with EventBatch(self._msg_queue) as batch:
+            print_app_msg(batch, "Recordatorio: {}".format(self.name))
+            event_audio_pomodoro_finished(batch)
 
-    def _is_pomodoro_ended(self):
-        pomodoro_in_seconds = 60 * self._pomodoro_time
-        return pomodoro_in_seconds <= self._since_last_pomodoro
+    def _session_state(self):
+        return {}
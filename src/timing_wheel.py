@@ -0,0 +1,105 @@
+"""
+Hierarchical timing wheel, the scheduler behind CountdownHost.
+
+Deadlines are rounded up to ticks of `resolution` seconds. A deadline goes to
+the lowest wheel whose slot holds it given the current tick: the first wheel
+has a slot per tick, every upper wheel a slot per whole lap of the one below.
+Firing the earliest slot of an upper wheel spreads it over the lower ones, so
+scheduling, cancelling and finding the next deadline cost the same with a
+handful of deadlines or with thousands.
+"""
+
+import math
+
+class Timeout:
+    __slots__ = ("tick", "deadline", "item", "_slot")
+
+    def __init__(self, tick, deadline, item):
+        self.tick = tick
+        self.deadline = deadline
+        self.item = item
+        self._slot = None
+
+class TimingWheel:
+    def __init__(self, origin, resolution=0.001, bits=6, levels=6):
+        self._origin = origin
+        self._resolution = resolution
+        self._bits = bits
+        self._mask = (1 << bits) - 1
+        self._wheels = [[set() for _ in range(1 << bits)] for _ in range(levels)]
+        self._sizes = [0] * levels
+        self._current = 0
+
+    def __len__(self):
+        return sum(self._sizes)
+
+    def schedule(self, deadline, item):
+        """Item is returned by pop_due once the monotonic time reaches the deadline"""
+        timeout = Timeout(max(self._current, math.ceil((deadline - self._origin) / self._resolution)), deadline, item)
+        self._place(timeout)
+        return timeout
+
+    def cancel(self, timeout):
+        if timeout._slot is not None:
+            level, slot = timeout._slot
+            self._wheels[level][slot].discard(timeout)
+            self._sizes[level] -= 1
+            timeout._slot = None
+
+    def next_deadline(self):
+        """Monotonic time of the earliest deadline, None when there is none"""
+        earliest = self._earliest_slot()
+        if earliest is None:
+            return None
+
+        level, slot = earliest
+        tick = min(timeout.tick for timeout in self._wheels[level][slot])
+        return self._origin + tick * self._resolution
+
+    def pop_due(self, now):
+        """Items whose deadline is at or before now, in deadline order"""
+        # The tolerance absorbs the rounding of waking up right at next_deadline()
+        target = math.floor((now - self._origin) / self._resolution + 1e-6)
+        due = []
+        while True:
+            earliest = self._earliest_slot()
+            if earliest is None:
+                return due
+
+            level, slot = earliest
+            timeouts = self._wheels[level][slot]
+            tick = min(timeout.tick for timeout in timeouts)
+            if target < tick:
+                return due
+
+            self._current = tick
+            self._wheels[level][slot] = set()
+            self._sizes[level] -= len(timeouts)
+            for timeout in sorted(timeouts, key=lambda timeout: timeout.tick):
+                timeout._slot = None
+                if timeout.tick <= self._current:
+                    due.append(timeout.item)
+                else:
+                    self._place(timeout)
+
+    def _place(self, timeout):
+        level = max(0, ((timeout.tick ^ self._current).bit_length() - 1) // self._bits)
+        if len(self._wheels) <= level:
+            raise RuntimeError("La cuenta atrás termina demasiado lejos en el tiempo")
+
+        slot = (timeout.tick >> (self._bits * level)) & self._mask
+        self._wheels[level][slot].add(timeout)
+        self._sizes[level] += 1
+        timeout._slot = (level, slot)
+
+    def _earliest_slot(self):
+        for level, size in enumerate(self._sizes):
+            if size == 0:
+                continue
+
+            wheel = self._wheels[level]
+            for slot in range((self._current >> (self._bits * level)) & self._mask, self._mask + 1):
+                if wheel[slot]:
+                    return level, slot
+
+        return None